@@ -0,0 +1,93 @@
+import json
+import os
+import numpy as np
+from functools import lru_cache
+
+from Coordinates.frame import CoordinateFrame
+
+## Base de données de la géométrie des cartes : un fichier JSON par variante de module (PPPV2...) dans le dossier
+## boards, avec les mires et les pads mesurés sur une image de référence, et la géométrie dans le repère absolu
+## précalculée. Une nouvelle variante s'ajoute en déposant son fichier, sans modifier le code. Rien n'est lu à
+## l'import : chaque variante est chargée à sa première utilisation, une seule fois.
+
+_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "boards")
+
+DEFAULT_VARIANT = "PPPV2"
+
+
+def geometrie(mires, pads):
+    """Computes the geometry of a board in the absolute coordinate system from the measures on its reference image.
+
+    Arguments :
+
+    mires - array of shape (8, 2) : the centers of the targets, in (row, column)
+
+    pads - array of shape (N, 2, 2) : two opposite corners of each pad, in (row, column)
+
+    Returns : dict : centre (x, y), dilat_ref, a (average horizontal slope), mat_passage, pads_nouveau_repere
+    """
+    mires = np.asarray(mires)
+    centre = np.flip(np.mean(mires, axis = 0).astype(np.int16)) #Pour avoir le centre en x,y
+    dilat_ref = 0.5*(np.linalg.norm(mires[0]-mires[5]) + np.linalg.norm(mires[1]-mires[4]))
+    a = sum([(mires[i+4,0]-mires[i,0])/(mires[i+4,1]-mires[i,1]) for i in range(0,4)])/4 #Pente horizontale moyenne
+    mat_passage = 1/np.sqrt(a**2 + 1) * np.array([[1,-a],[a,1]])
+    pads_nouveau_repere = CoordinateFrame(mat_passage, np.flip(centre)).to_absolute(np.asarray(pads)).astype(np.int16)
+    return {"centre" : centre.tolist(), "dilat_ref" : float(dilat_ref), "a" : float(a),
+            "mat_passage" : mat_passage.tolist(), "pads_nouveau_repere" : pads_nouveau_repere.tolist()}
+
+
+class BoardGeometry :
+    """Targets and pads of one board variant, with their geometry in the absolute coordinate system.
+
+    Arguments :
+
+    record - dict : the content of the JSON file of the variant (the derived geometry is computed if it is missing)
+    """
+
+    def __init__ (self, record) :
+        if "pads_nouveau_repere" not in record :
+            record = dict(record, **geometrie(record["mires"], record["pads"]))
+        self.variant = record["variant"]
+        self.mires = np.array(record["mires"])
+        self.pads = np.array(record["pads"])
+        self.centre = np.array(record["centre"], dtype=np.int16)
+        self.dilat_ref = record["dilat_ref"]
+        self.a = record["a"]
+        self.mat_passage = np.array(record["mat_passage"])
+        self.pads_nouveau_repere = np.array(record["pads_nouveau_repere"], dtype=np.int16)
+
+
+@lru_cache(maxsize=None)
+def variantes():
+    """Returns : tuple of str : the variants with a file in the database"""
+    return tuple(sorted(os.path.splitext(nom)[0] for nom in os.listdir(_folder) if nom.endswith(".json")))
+
+
+def variante(path):
+    """Reads the variant of a module in the name of its image (e.g. "PPPV2" in 20UPGM23210148_PPPV2_45_AfterBonding_OK.jpg)
+
+    The variant is a known one, or else the word following the serial number : a variant without a file in the database
+    is an error (its geometry is unknown), and only a name without any variant gets the default one.
+
+    Returns : str : the variant, DEFAULT_VARIANT if the name contains none
+    """
+    mots = os.path.splitext(os.path.basename(path))[0].split("_")
+    for x in mots :
+        if x in variantes() :
+            return x
+    for i, x in enumerate(mots[:-1]) :
+        suivant = mots[i+1]
+        if "20UPGM" in x and suivant.isalnum() and not suivant.isdigit() and not suivant.startswith(("Reception", "After")) :
+            assert False, "Unknown board variant : " + suivant + " (no " + suivant + ".json in " + _folder + ")"
+    return DEFAULT_VARIANT
+
+
+@lru_cache(maxsize=None)
+def board(variant = DEFAULT_VARIANT):
+    """Loads the geometry of a board variant, only the first time it is asked for
+
+    Returns : BoardGeometry
+    """
+    assert variant in variantes(), "Unknown board variant : " + variant
+    with open(os.path.join(_folder, variant + ".json"), "r") as f :
+        return BoardGeometry(json.load(f))
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+
+from Wiring_Checks.count import extract_serial_number
+
+
+## Cache sur disque de la calibration des images non câblées (mires, matrice de passage, intersection, dilatation) :
+## une image "Reception" ne change plus une fois le module reçu, elle n'est donc analysée qu'une seule fois.
+## Un fichier JSON par numéro de série, dans le dossier .calibration à côté des images par défaut.
+
+# Version des algorithmes de calibration (mires, matrice_psg) : à incrémenter quand leurs résultats changent, pour que
+# les entrées calculées par une version précédente soient recalculées
+VERSION = 2
+
+
+def _ecrire_json(fichier, entree):
+    """Writes a JSON file atomically : through a temporary file of its own, then renamed, so that a concurrent reader
+    never sees a partial file and two writers never share a temporary file"""
+    descripteur, temporaire = tempfile.mkstemp(dir=os.path.dirname(fichier), suffix=".tmp")
+    try :
+        with os.fdopen(descripteur, "w") as f :
+            json.dump(entree, f, indent=4)
+        os.replace(temporaire, fichier)
+    except BaseException :
+        os.remove(temporaire)
+        raise
+
+def dossier_calibration(path, dossier = None):
+    """Returns : str : the folder of the calibration files of an image (dossier if given)"""
+    return os.path.join(os.path.dirname(os.path.abspath(path)), ".calibration") if dossier is None else dossier
+
+
+def empreinte(path):
+    """Hashes the content of a file (SHA-256), by blocks of 1 MiB.
+
+    Returns : str
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f :
+        for bloc in iter(lambda : f.read(2**20), b"") :
+            h.update(bloc)
+    return h.hexdigest()
+
+
+def lire_calibration(path, dossier = None):
+    """Reads the calibration of an unwired image, if it was computed on the same content.
+
+    The size and modification time of the file are checked first : the content is only hashed again if they changed
+    (and the cache entry is kept if the content did not).
+
+    Arguments :
+
+    path - string : the path to the unwired image.
+
+    dossier - string : the folder of the calibration files, see dossier_calibration.
+
+    Returns : tuple (np.ndarray, np.ndarray, tuple, float) : centers of the targets, transition matrix, intersection point
+    and dilatation (as returned by mires and matrice_psg), None if there is no valid calibration (missing, unreadable,
+    or computed by another VERSION of the algorithms).
+    """
+    fichier = os.path.join(dossier_calibration(path, dossier), extract_serial_number(os.path.basename(path)) + ".json")
+    if not os.path.exists(fichier) :
+        return None
+    try :
+        with open(fichier, "r") as f :
+            entree = json.load(f)
+
+        status = os.stat(path)
+        if entree.get("version") != VERSION or entree["image"] != os.path.basename(path) :
+            return None
+        if (entree["size"], entree["mtime"]) != (status.st_size, status.st_mtime) :
+            if entree["sha256"] != empreinte(path) :
+                return None
+            entree["size"], entree["mtime"] = status.st_size, status.st_mtime # fichier touché mais identique
+            _ecrire_json(fichier, entree)
+
+        return (np.array(entree["centres"]), np.array(entree["matrice"]), tuple(entree["intersection"]), entree["dilatation"])
+    except (json.JSONDecodeError, KeyError, TypeError) : # entrée abîmée : on recalcule
+        return None
+
+
+def ecrire_calibration(path, centres, matrice, intersection, dilatation, dossier = None):
+    """Saves the calibration of an unwired image, see lire_calibration.
+
+    Arguments :
+
+    path - string : the path to the unwired image.
+
+    centres, matrice, intersection, dilatation : the results of mires and matrice_psg on this image.
+
+    dossier - string : the folder of the calibration files, see dossier_calibration.
+    """
+    dossier = dossier_calibration(path, dossier)
+    os.makedirs(dossier, exist_ok=True)
+    status = os.stat(path)
+    entree = {"version" : VERSION,
+              "image" : os.path.basename(path),
+              "size" : status.st_size,
+              "mtime" : status.st_mtime,
+              "sha256" : empreinte(path),
+              "centres" : np.asarray(centres).tolist(),
+              "matrice" : np.asarray(matrice).tolist(),
+              "intersection" : [int(x) for x in intersection],
+              "dilatation" : float(dilatation)}
+    _ecrire_json(os.path.join(dossier, extract_serial_number(os.path.basename(path)) + ".json"), entree)
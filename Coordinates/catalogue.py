@@ -0,0 +1,107 @@
+import os
+
+
+## Catalogue des images d'un dossier, indexées par module et par étape (Reception, AfterBonding, AfterWirebonding...) :
+## le dossier n'est relu que si sa date de modification a changé, et seuls les fichiers ajoutés ou supprimés sont traités.
+
+def etape_image(nom):
+    """Splits the name of an image in its module prefix (everything before the stage, e.g. "20UPGM23210148_PPPV2_45_")
+    and its stage ("Reception", "AfterBonding", "AfterWirebonding"...).
+
+    Returns : (str, str) : the prefix and the stage, None if the name contains no stage
+    """
+    for mot in ("Reception", "After") :
+        debut = nom.find(mot)
+        if debut != -1 :
+            fin = debut + len(mot)
+            while fin < len(nom) and nom[fin] not in "_." :
+                fin += 1
+            return nom[:debut], nom[debut:fin]
+    return None
+
+
+class ImageCatalogue :
+    """Images of a folder, indexed by module and by stage.
+
+    Arguments :
+
+    dossier - str : the folder under which the images are located.
+    """
+
+    def __init__ (self, dossier) :
+        self.dossier = dossier
+        self._mtime = None
+        self._noms = set()
+        self._modules = {} # préfixe -> {étape : [noms]}
+
+    def refresh (self) :
+        """Reads the folder again if it was modified since the last reading, and updates the index with the differences"""
+        mtime = os.stat(self.dossier).st_mtime_ns
+        if mtime == self._mtime :
+            return
+        noms = set(entree.name for entree in os.scandir(self.dossier) if entree.is_file())
+        for nom in sorted(noms - self._noms) :
+            cle = etape_image(nom)
+            if cle is not None :
+                self._modules.setdefault(cle[0], {}).setdefault(cle[1], []).append(nom)
+        for nom in self._noms - noms :
+            cle = etape_image(nom)
+            if cle is not None :
+                self._modules[cle[0]][cle[1]].remove(nom)
+                if len(self._modules[cle[0]][cle[1]]) == 0 :
+                    del self._modules[cle[0]][cle[1]]
+                if len(self._modules[cle[0]]) == 0 :
+                    del self._modules[cle[0]]
+        self._noms = noms
+        self._mtime = mtime
+
+    def images (self, prefixe, etape = None) :
+        """Gives the images of a module, of one stage or of all of them
+
+        Arguments :
+
+        prefixe - str : the module prefix of the images, see etape_image
+
+        etape - str : the stage, all of them if None
+
+        Returns : list of str : the names of the images
+        """
+        self.refresh()
+        etapes = self._modules.get(prefixe, {})
+        if etape is not None :
+            return list(etapes.get(etape, []))
+        return [nom for noms in etapes.values() for nom in noms]
+
+    def paire (self, fichier) :
+        """Finds the image corresponding to a given input : an unwired image for a wired one, and the reverse.
+
+        Returns : str : the name of the matching file, "Pas de paire" if there is none.
+        """
+        cle = etape_image(os.path.basename(fichier))
+        if cle is not None :
+            self.refresh()
+            etapes = self._modules.get(cle[0], {})
+            for etape, noms in etapes.items() :
+                if etape.startswith("Reception") != cle[1].startswith("Reception") :
+                    return noms[0]
+        return "Pas de paire"
+
+    def modules_complets (self) :
+        """Gives every module with both an unwired and a wired image
+
+        Returns : list of str : the module prefixes
+        """
+        self.refresh()
+        return [prefixe for prefixe, etapes in self._modules.items()
+                if any(etape.startswith("Reception") for etape in etapes) and any(etape.startswith("After") for etape in etapes)]
+
+
+# Un catalogue par dossier, partagé par tout le programme
+_catalogues = {}
+
+def catalogue(dossier):
+    """Returns : ImageCatalogue : the catalogue of a folder, created on the first call"""
+    cle = os.path.abspath(dossier)
+    if cle not in _catalogues :
+        _catalogues[cle] = ImageCatalogue(dossier)
+    return _catalogues[cle]
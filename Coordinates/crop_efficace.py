@@ -1,12 +1,13 @@
 ### Imports
 
-from Wiring_Checks.wire import isWhite, bfsWire
+from Wiring_Checks.mask import WhiteMask
+from Wiring_Checks.labeling import FOUR_CONNECTIVITY
 
+import os
 import numpy as np
-import pandas as pd
+import scipy.ndimage
+from concurrent.futures import ThreadPoolExecutor
 import cv2 as cv
-import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
 
 
 
@@ -23,85 +24,65 @@ def norme(pix):
 
 ### Trouver les bords verts ###
 
+# Trouver les quatre bords verts d'un coup : le masque des pixels verts est calculé une seule fois (images en uint8),
+# puis projeté sur les colonnes et sur les lignes. Mêmes critères que les boucles d'origine : 40 < R,V < 100 et B < 20
+# pour le bord gauche, 30 < R,V < 100 et B < 20 pour les trois autres, un bord étant la première colonne (ligne) depuis
+# l'extérieur contenant plus de 0.1*largeur (0.1*hauteur) pixels verts. Si aucune ne convient, le résultat est celui des
+# boucles d'origine : l'autre extrémité de l'image
+def find_bords(image):
+    hauteur, largeur = image.shape[:2]
+    vert_30 = cv.inRange(image, (31, 31, 0), (99, 99, 19))
+    vert_40 = cv.inRange(image, (41, 41, 0), (99, 99, 19))
+
+    # projections : nombre de pixels verts par colonne et par ligne (les masques valent 0 ou 255)
+    def projection(masque, axe):
+        return cv.reduce(masque, axe, cv.REDUCE_SUM, dtype=cv.CV_32S).ravel()//255
+
+    colonnes_40 = projection(vert_40, 0) > 0.1*largeur
+    colonnes_30 = projection(vert_30, 0) > 0.1*largeur
+    lignes_30 = projection(vert_30, 1) > 0.1*hauteur
+
+    # on ne teste pas la dernière colonne (ligne), comme les boucles d'origine
+    def premier(valides, n):
+        trouves = np.flatnonzero(valides[:n-1])
+        return int(trouves[0]) if len(trouves) != 0 else n-1
+
+    bord_gauche = premier(colonnes_40, largeur)
+    bord_droit = largeur-1-premier(colonnes_30[::-1], largeur)
+    bord_haut = premier(lignes_30, hauteur)
+    bord_bas = hauteur-1-premier(lignes_30[::-1], hauteur)
+    return bord_gauche, bord_droit, bord_haut, bord_bas
+
+
 # Trouver la colonne verte à gauche : return le numéro de la colonne et la colonne
 def find_colonne_v2_gauche(image):
-    colonnes=[image[:,i,:] for i in range(image.shape[1])]
-    i=0
-    bool=False
-    while not bool and i<len(colonnes)-1:
-        col=colonnes[i]
-        cpt=0
-        for pix in col:
-            if (40<pix[0]<100) and (40<pix[1]<100) and  (pix[2]<20):
-                cpt+=1       
-        if cpt>0.1*image.shape[1]:
-            bool=True
-        if not bool:
-            i+=1
-    return i, colonnes[i]
+    i=find_bords(image)[0]
+    return i, image[:,i,:]
 
 
 # Trouver la colonne verte à droite : return le numéro de la colonne et la colonne
 def find_colonne_v2_droite(image):
-    colonnes=[image[:,i,:] for i in range(image.shape[1])]
-    i=0
-    bool=False
-    while not bool and i<len(colonnes)-1:
-        col=colonnes[image.shape[1]-i-1]
-        cpt=0
-        for pix in col:
-            if (30<pix[0]<100) and (30<pix[1]<100) and  (pix[2]<20):
-                cpt+=1       
-        if cpt>0.1*image.shape[1]:
-            bool=True
-        if not bool:
-            i+=1
-    return image.shape[1]-i-1, col
+    i=find_bords(image)[1]
+    return i, image[:,max(i,1),:] # si rien n'est trouvé, la dernière colonne testée est la colonne 1
 
 
 # Trouver la ligne verte haute : return le numéro de la colonne et la colonne
 def find_ligne_v2_haute(image):
-    lignes=[image[i,:,:] for i in range(image.shape[0])]
-    i=0
-    bool=False
-    while not bool and i<len(lignes)-1:
-        lin=lignes[i]
-        cpt=0
-        for pix in lin:
-            if (30<pix[0]<100) and (30<pix[1]<100) and  (pix[2]<20):
-                cpt+=1       
-        if cpt>0.1*image.shape[0]:
-            bool=True
-        if not bool:
-            i+=1
-    return i, lin
+    i=find_bords(image)[2]
+    return i, image[min(i,image.shape[0]-2),:,:] # si rien n'est trouvé, la dernière ligne testée est l'avant-dernière
 
 
 # Trouver la ligne verte basse : return le numéro de la colonne et la colonne
 def find_ligne_v2_basse(image):
-    lignes=[image[i,:,:] for i in range(image.shape[0])]
-    i=0
-    bool=False
-    while not bool and i<len(lignes)-1:
-        lin=lignes[image.shape[0]-i-1]
-        cpt=0
-        for pix in lin:
-            if (30<pix[0]<100) and (30<pix[1]<100) and  (pix[2]<20):
-                cpt+=1       
-        if cpt>0.1*image.shape[0]:
-            bool=True
-        if not bool:
-            i+=1
-    return image.shape[0]-i-1, lin
+    i=find_bords(image)[3]
+    return i, image[max(i,1),:,:] # si rien n'est trouvé, la dernière ligne testée est la ligne 1
 
 
 # Test : affiche l'image et tous ses bords détectés
 def verif_bords(image):
-    bord_gauche=find_colonne_v2_gauche(image)[0]
-    bord_droit=find_colonne_v2_droite(image)[0]
-    bord_haut=find_ligne_v2_haute(image)[0]
-    bord_bas=find_ligne_v2_basse(image)[0]
+    bord_gauche, bord_droit, bord_haut, bord_bas = find_bords(image)
 
+    import matplotlib.pyplot as plt #Chargé seulement pour les fonctions de test qui dessinent
     plt.imshow(image)
     plt.scatter(bord_gauche, 0, color='tab:red', marker='+', s=300)
     plt.scatter(bord_droit, 0, color='tab:red', marker='+', s=300)
@@ -116,15 +97,70 @@ def verif_bords(image):
 
 ### Croper sur les bords des pads ###
 
-def croper_details_sans_rotation(image):
+# Nombre de threads se partageant les bouts par défaut
+WORKERS = min(4, os.cpu_count() or 1)
+
+
+# Masque des pixels blancs de image[lignes, colonnes] : lu dans le masque de toute l'image s'il est fourni, sinon
+# calculé sur cette zone seulement (les deux bandes de fils ne font que quelques pourcents de l'image)
+def masque_zone(image, mask, lignes, colonnes):
+    if mask is not None:
+        return mask.crop(lignes, colonnes)
+    return WhiteMask(image[lignes, colonnes])
+
+
+# Bouts de l'image compressée utilisés pour trouver les fils : nb_bouts bouts de delta lignes, espacés de 5*delta lignes
+def decoupe_bouts(test_compressed, nb_bouts=10):
+    delta=int(test_compressed.shape[0]/(nb_bouts*5))
+    return [(i*delta, min((i+1)*delta, test_compressed.shape[0])) for i in range(0, nb_bouts*50, 5) if i*delta < test_compressed.shape[0]]
+
+
+# Colonne extrême des fils partant de la colonne donnée, dans chaque bout : tous les bouts sont labellisés en une seule
+# passe (empilés, séparés par une ligne de fond pour qu'un fil ne passe pas d'un bout à l'autre), puis on lit les
+# labels de la colonne de départ et on prend les boîtes englobantes de ces labels
+# cote : "gauche" pour la colonne minimale, "droite" pour la colonne maximale ; None pour un bout sans fil
+def extremes_bouts(test_compressed, bouts, colonne, cote):
+    debuts=np.cumsum([0]+[fin-debut+1 for debut, fin in bouts])
+    empile=np.zeros((debuts[-1], test_compressed.shape[1]), dtype=bool)
+    for (debut, fin), d in zip(bouts, debuts):
+        empile[d:d+fin-debut]=test_compressed.rows(debut, fin).unpack()
+    labels, n = scipy.ndimage.label(empile, structure=FOUR_CONNECTIVITY)
+    colonnes=scipy.ndimage.find_objects(labels)
+    bornes=np.array([c.start if cote=="gauche" else c.stop-1 for _, c in colonnes], dtype=np.int64)
+
+    extremes=[]
+    for (debut, fin), d in zip(bouts, debuts):
+        graines=np.unique(labels[d:d+fin-debut, colonne])
+        graines=graines[graines>0]
+        if len(graines)==0:
+            extremes.append(None)
+        else:
+            extremes.append(int(bornes[graines-1].min() if cote=="gauche" else bornes[graines-1].max()))
+    return extremes
+
+
+# Extrêmes de tous les bouts qui contiennent des fils, les bouts étant répartis entre workers threads
+def extremes_fils(test_compressed, cote, workers=WORKERS):
+    bouts=decoupe_bouts(test_compressed)
+    colonne=test_compressed.shape[1]-10 if cote=="gauche" else 10
+    paquets=[bouts[k::workers] for k in range(workers)]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        resultats=list(pool.map(lambda paquet : extremes_bouts(test_compressed, paquet, colonne, cote), paquets))
+    extremes=[None]*len(bouts)
+    for k, resultat in enumerate(resultats):
+        extremes[k::workers]=resultat
+    return [e for e in extremes if e is not None]
+
+
+def croper_details_sans_rotation(image, mask=None, workers=WORKERS):
     # Affiche le détail des calculs pour croper l'image, montre les images correspondantes mais ne return rien
+    # mask : WhiteMask de l'image si on l'a déjà, sinon le masque n'est calculé que sur les deux bandes utiles
+    # workers : nombre de threads se partageant les bouts
 
     # On préréduit l'image pour trouver les fils plus simplement
-    bord_gauche=find_colonne_v2_gauche(image)[0]
-    bord_droit=find_colonne_v2_droite(image)[0]
-    bord_haut=find_ligne_v2_haute(image)[0]
-    bord_bas=find_ligne_v2_basse(image)[0]
+    bord_gauche, bord_droit, bord_haut, bord_bas = find_bords(image)
 
+    import matplotlib.pyplot as plt #Chargé seulement pour les fonctions de test qui dessinent
     plt.imshow(image)
     plt.scatter(bord_gauche, 0, color='tab:red', marker='+', s=300)
     plt.scatter(bord_droit, 0, color='tab:red', marker='+', s=300)
@@ -146,33 +182,10 @@ def croper_details_sans_rotation(image):
 
     bounds_g=bord_gauche-300
     bounds_d=bord_gauche-50
-    test_compressed = image[bounds_h:bounds_b:2,bounds_g:bounds_d:2,:]
+    test_compressed = masque_zone(image, mask, slice(bounds_h,bounds_b,2), slice(bounds_g,bounds_d,2))
 
-    # On découpe en plusieurs bouts
-    nb_bouts=10
-    delta=int(test_compressed.shape[0]/(nb_bouts*5))
-    liste_images=[test_compressed[i*delta:(i+1)*delta, :,:] for i in range(0,nb_bouts*50, 5)]
-
-    # On fait le truc sur chaque bout             
-    liste_de_mins_g=[]
-    for ind, e in enumerate(liste_images):
-        list = []
-        for i in range(len(e)):
-            if isWhite(e,(i,e.shape[1]-10)):
-                list += bfsWire(e,(i,e.shape[1]-10))
-
-        test_copy = e.copy()
-
-        for coord in list:
-            test_copy[coord[0],coord[1],:] = np.array([255,0,0])
-        
-        # recherche du minimum
-        if len(list)!=0:
-            min=list[0]
-            for pt in list:
-                if pt[1]<min[1]:
-                    min=pt
-            liste_de_mins_g.append(min[1])
+    # On découpe en plusieurs bouts, et on cherche dans chacun la colonne minimale des fils
+    liste_de_mins_g=extremes_fils(test_compressed, "gauche", workers)
     
     print(f'Nombre de bouts de fils utilisés à gauche : {len(liste_de_mins_g)}')
     
@@ -192,33 +205,10 @@ def croper_details_sans_rotation(image):
 
     bounds_d=bord_droit+300
     bounds_g=bord_droit+50
-    test_compressed = image[bounds_h:bounds_b:2,bounds_g:bounds_d:2,:]
+    test_compressed = masque_zone(image, mask, slice(bounds_h,bounds_b,2), slice(bounds_g,bounds_d,2))
 
-    # On découpe en plusieurs bouts
-    nb_bouts=10
-    delta=int(test_compressed.shape[0]/(nb_bouts*5))
-    liste_images=[test_compressed[i*delta:(i+1)*delta, :,:] for i in range(0,nb_bouts*50, 5)]
-
-    # On fait le truc sur chaque bout             
-    liste_de_maxs_d=[]
-    for ind, e in enumerate(liste_images):
-        list = []
-        for i in range(len(e)):
-            if isWhite(e,(i,10)):
-                list += bfsWire(e,(i,10))
-
-        test_copy = e.copy()
-
-        for coord in list:
-            test_copy[coord[0],coord[1],:] = np.array([255,0,0])
-        
-        # recherche du maximum
-        if len(list)!=0:
-            max=list[0]
-            for pt in list:
-                if pt[1]>min[1]:
-                    min=pt
-            liste_de_maxs_d.append(min[1])
+    # On découpe en plusieurs bouts, et on cherche dans chacun la colonne maximale des fils
+    liste_de_maxs_d=extremes_fils(test_compressed, "droite", workers)
     
     print(f'Nombre de bouts de fils utilisés à droite : {len(liste_de_maxs_d)}')
     
@@ -239,14 +229,13 @@ def croper_details_sans_rotation(image):
 
 
 
-def croper(image):
+def croper(image, mask=None, workers=WORKERS):
     # On return juste l'image cropée
+    # mask : WhiteMask de l'image si on l'a déjà, sinon le masque n'est calculé que sur les deux bandes utiles
+    # workers : nombre de threads se partageant les bouts
 
     # On préréduit l'image pour trouver les fils plus simplement
-    bord_gauche=find_colonne_v2_gauche(image)[0]
-    bord_droit=find_colonne_v2_droite(image)[0]
-    bord_haut=find_ligne_v2_haute(image)[0]
-    bord_bas=find_ligne_v2_basse(image)[0]
+    bord_gauche, bord_droit, bord_haut, bord_bas = find_bords(image)
     
     bounds_h=1000
     bounds_b=5000
@@ -257,33 +246,10 @@ def croper(image):
 
     bounds_g=bord_gauche-300
     bounds_d=bord_gauche-50
-    test_compressed = image[bounds_h:bounds_b:2,bounds_g:bounds_d:2,:]
+    test_compressed = masque_zone(image, mask, slice(bounds_h,bounds_b,2), slice(bounds_g,bounds_d,2))
 
-    # On découpe en plusieurs bouts
-    nb_bouts=10
-    delta=int(test_compressed.shape[0]/(nb_bouts*5))
-    liste_images=[test_compressed[i*delta:(i+1)*delta, :,:] for i in range(0,nb_bouts*50, 5)]
-
-    # On fait le truc sur chaque bout             
-    liste_de_mins_g=[]
-    for ind, e in enumerate(liste_images):
-        list = []
-        for i in range(len(e)):
-            if isWhite(e,(i,e.shape[1]-10)):
-                list += bfsWire(e,(i,e.shape[1]-10))
-
-        test_copy = e.copy()
-
-        for coord in list:
-            test_copy[coord[0],coord[1],:] = np.array([255,0,0])
-        
-        # recherche du minimum
-        if len(list)!=0:
-            min=list[0]
-            for pt in list:
-                if pt[1]<min[1]:
-                    min=pt
-            liste_de_mins_g.append(min[1])
+    # On découpe en plusieurs bouts, et on cherche dans chacun la colonne minimale des fils
+    liste_de_mins_g=extremes_fils(test_compressed, "gauche", workers)
     
     min_ou_croper_g=2*np.min(liste_de_mins_g)+bounds_g
 
@@ -293,33 +259,10 @@ def croper(image):
 
     bounds_d=bord_droit+300
     bounds_g=bord_droit+50
-    test_compressed = image[bounds_h:bounds_b:2,bounds_g:bounds_d:2,:]
+    test_compressed = masque_zone(image, mask, slice(bounds_h,bounds_b,2), slice(bounds_g,bounds_d,2))
 
-    # On découpe en plusieurs bouts
-    nb_bouts=10
-    delta=int(test_compressed.shape[0]/(nb_bouts*5))
-    liste_images=[test_compressed[i*delta:(i+1)*delta, :,:] for i in range(0,nb_bouts*50, 5)]
-
-    # On fait le truc sur chaque bout             
-    liste_de_maxs_d=[]
-    for ind, e in enumerate(liste_images):
-        list = []
-        for i in range(len(e)):
-            if isWhite(e,(i,10)):
-                list += bfsWire(e,(i,10))
-
-        test_copy = e.copy()
-
-        for coord in list:
-            test_copy[coord[0],coord[1],:] = np.array([255,0,0])
-        
-        # recherche du maximum
-        if len(list)!=0:
-            max=list[0]
-            for pt in list:
-                if pt[1]>min[1]:
-                    min=pt
-            liste_de_maxs_d.append(min[1])
+    # On découpe en plusieurs bouts, et on cherche dans chacun la colonne maximale des fils
+    liste_de_maxs_d=extremes_fils(test_compressed, "droite", workers)
     
 
     max_ou_croper_d=2*np.max(liste_de_maxs_d)+bounds_g
@@ -1,62 +1,250 @@
 import cv2 as cv
+import os
 import numpy as np
-import matplotlib.pyplot as plt
-import scipy.stats as stats
+from concurrent.futures import ThreadPoolExecutor
+from itertools import combinations
 from Coordinates.utils import *
-from Coordinates.data import *
+from Coordinates.boards import board, variante
+from Coordinates.calibration import lire_calibration, ecrire_calibration
+from Coordinates.frame import CoordinateFrame
+from Wiring_Checks.images import read_image
+from Wiring_Checks.profiling import stage
 
 
 ## Fonction pour trouver les mires sur l'image non câblée
 
-def mires(img_input:np.ndarray, draw = False):
+def cercles_mires(img, nbmires):
+    """Finds at most nbmires targets in a greyscale image (the strongest circles of the right size first).
+
+    Returns : np.ndarray : array of (x, y, radius)
+    """
+    #Blur pour réduire le bruit
+    mask = cv.medianBlur(img,5)
+    #Fonction qui détecte les cercles
+    circles = cv.HoughCircles(mask,cv.HOUGH_GRADIENT,1,minDist = 100,
+                                param1=50,param2=20,minRadius=20 ,maxRadius=30)
+    if circles is None :
+        return np.zeros((0,3),dtype=np.int64)
+    return np.int64(np.around(circles[0,:nbmires]))
+
+
+# Zones de recherche fixes des mires, en pleine résolution (lignes de début et de fin, colonnes de début et de fin,
+# nombre de mires) : elles ne servent plus que de repli, si la passe grossière ne trouve pas la disposition des mires
+sliceparams = [(100, 400, 300, 600, 1),
+               (-400, -100, 300, 600, 1),
+               (3800, 4200, 500, 800, 2),
+               (100, 400, -600,-300, 1),
+               (-400, -100, -600, -300, 1),
+               (3800, 4200, -800, -500, 2)]
+
+
+def fenetres_fixes(height, length):
+    """Returns : list of (int, int, int, int, int) : the fixed search zones (sliceparams), in positive coordinates"""
+    return [(beg1%height, (end1-1)%height+1, beg2%length, (end2-1)%length+1, nbmires) for (beg1, end1, beg2, end2, nbmires) in sliceparams]
+
+
+def ecart_disposition(positions, height, length, ecarts_paires = (0, 0)):
+    """Compares the positions of the 6 zones of targets to the layout of the board : on each half, a target at the top,
+    a pair in the middle and a target at the bottom, the two halves being mirror images of each other (up to a
+    translation and a small rotation of the board).
+
+    Arguments :
+
+    positions - array of shape (6, 2) : the (x, y) of the zones, top left, bottom left, middle left, then the right side
+
+    height, length - int : the size of the image
+
+    ecarts_paires (optional) - (float, float) : the distance between the two targets of the left and right pairs (0 if
+    unknown)
+
+    Returns : float : the largest gap to the layout, relative to the size of the image (inf if the order is wrong)
+    """
+    p = np.asarray(positions, dtype=np.float64)
+    gauche, droite = p[:3], p[3:]
+    for cote in (gauche, droite) :
+        #De haut en bas : mire seule, paire, mire seule, sur au moins la moitié de la hauteur
+        if not (cote[0,1] < cote[2,1] < cote[1,1]) or cote[1,1] - cote[0,1] < height/2 :
+            return np.inf
+    if not (gauche[:,0] < droite[:,0]).all() :
+        return np.inf
+    decalage = gauche[:,1] - droite[:,1] #Même décalage de ligne entre les deux côtés pour les trois zones
+    largeur = droite[:,0] - gauche[:,0] #Même largeur en haut et en bas, paires rentrées d'autant des deux côtés
+    ecarts = [(decalage.max() - decalage.min())/height,
+              abs(largeur[0] - largeur[1])/length,
+              abs((gauche[2,0] - gauche[0,0]) - (droite[0,0] - droite[2,0]))/length,
+              abs((gauche[0,0] - gauche[1,0]) - (droite[0,0] - droite[1,0]))/length]
+    if min(ecarts_paires) > 0 :
+        ecarts.append(abs(ecarts_paires[0] - ecarts_paires[1])/length)
+    return max(ecarts)
+
+
+def fenetres_mires(img, reduction = 4, distance = 300, marge = 200, tolerance = 0.02, nb_groupes = 6):
+    """Coarse pass : finds the circles of the size of a target on a reduced image, and groups the ones closer than
+    distance pixels. Among the nb_groupes strongest groups of each half of the image, the zones of the targets are the
+    three groups per half closest to the layout of the board (see ecart_disposition) : from top to bottom, one target,
+    two targets and one target.
+
+    Arguments :
+
+    img - array of pixels : the working image (greyscale, full resolution)
+
+    reduction - int : the reduction factor of the coarse pass
+
+    distance - int : maximal distance between two circles of the same group, in full resolution pixels
+
+    marge - int : number of pixels added around a group to make its search window
+
+    tolerance - float : largest gap to the layout accepted, relative to the size of the image
+
+    nb_groupes - int : number of groups considered on each half
+
+    Returns :
+
+    zones - list of (int, int, int, int, int) : for each zone, first and last rows, first and last columns of its
+    window, and number of targets, in the order of the targets (top left, bottom left, middle left, then the right side)
+
+    candidats - list of lists of (x, y) : the circles of each zone, in full resolution coordinates and in the order of
+    their strength
+
+    (None, None) if no choice of groups matches the layout
+    """
+    (height,length) = img.shape
+    petite = cv.resize(img, None, fx=1/reduction, fy=1/reduction, interpolation=cv.INTER_AREA)
+    circles = cv.HoughCircles(cv.medianBlur(petite,3),cv.HOUGH_GRADIENT,1,minDist = 100//reduction,
+                              param1=50,param2=10,minRadius=20//reduction ,maxRadius=30//reduction+1)
+    if circles is None :
+        return None, None
+    centres = np.around(circles[0,:,:2]*reduction).astype(np.int64) #Triés par force décroissante
+
+    #Groupes : composantes connexes des cercles à moins de distance les uns des autres
+    proches = np.hypot(*(centres[:,None,:] - centres[None,:,:]).transpose(2,0,1)) <= distance
+    groupes = np.arange(len(centres))
+    while True :
+        suivants = np.where(proches, groupes[None,:], len(centres)).min(axis=1)
+        if (suivants == groupes).all() :
+            break
+        groupes = suivants
+
+    #Groupes les plus forts de chaque moitié (un groupe est numéroté par son cercle le plus fort), avec leur position
+    moyennes = {g : centres[groupes == g].mean(axis=0) for g in np.unique(groupes)}
+    moities = [[g for g in moyennes if (moyennes[g][0] < length/2) == gauche][:nb_groupes] for gauche in (True, False)]
+
+    def triplets(forts) :
+        #Trois groupes d'une moitié, dans l'ordre mire du haut, mire du bas, paire du milieu
+        for trois in combinations(forts, 3) :
+            haut, milieu, bas = sorted(trois, key=lambda g : moyennes[g][1])
+            yield (haut, bas, milieu)
+
+    def ecart_paire(g) :
+        membres = centres[groupes == g]
+        return np.hypot(*(membres[1] - membres[0])) if len(membres) == 2 else 0
+
+    meilleur, choix = np.inf, None
+    for gauche in triplets(moities[0]) :
+        for droite in triplets(moities[1]) :
+            ecart = ecart_disposition([moyennes[g] for g in gauche + droite], height, length,
+                                      (ecart_paire(gauche[2]), ecart_paire(droite[2])))
+            #A écart égal, on préfère des paires complètes et des groupes forts
+            score = ecart + 0.01*sum(len(centres[groupes == g]) < 2 for g in (gauche[2], droite[2])) + 1e-6*sum(gauche + droite)
+            if ecart <= tolerance and score < meilleur :
+                meilleur, choix = score, gauche + droite
+    if choix is None :
+        return None, None
+
+    zones, candidats = [], []
+    for g, nbmires in zip(choix, (1, 1, 2, 1, 1, 2)) :
+        membres = centres[groupes == g]
+        zones.append((max(membres[:,1].min() - marge, 0), min(membres[:,1].max() + marge, height),
+                      max(membres[:,0].min() - marge, 0), min(membres[:,0].max() + marge, length), nbmires))
+        candidats.append(list(membres))
+    return zones, candidats
+
+
+def disposition_mires(centers, height, length, tolerance = 0.02):
+    """Checks that the 8 targets found match the layout of the board (see ecart_disposition)
+
+    Returns : bool
+    """
+    if len(centers) != 8 :
+        return False
+    c = np.asarray(centers, dtype=np.float64)
+    positions = [c[0], c[1], c[2:4].mean(axis=0), c[4], c[5], c[6:8].mean(axis=0)]
+    paires = (np.hypot(*(c[3] - c[2])), np.hypot(*(c[7] - c[6])))
+    return ecart_disposition(positions, height, length, paires) <= tolerance
+
+
+def mires_zone(img, zone, candidats, rayon = 60):
+    """Fine pass on one search zone : refines every candidate on a small full resolution patch around it, or searches
+    the whole window of the zone at full resolution if there are not enough candidates.
+
+    Returns : list of (x, y, radius) : the targets found in the zone, from top to bottom
+    """
+    (height,length) = img.shape
+    (beg1, end1, beg2, end2, nbmires) = zone
+    trouves = []
+    for (x, y) in candidats :
+        if len(trouves) == nbmires :
+            break
+        r0, c0 = max(y - rayon, 0), max(x - rayon, 0)
+        circles = cercles_mires(img[r0:min(y + rayon, height), c0:min(x + rayon, length)], 1)
+        if len(circles) != 0 and all(np.hypot(circles[0,0] + c0 - u, circles[0,1] + r0 - v) > rayon for (u, v, _) in trouves) :
+            trouves.append((circles[0,0] + c0, circles[0,1] + r0, circles[0,2])) #Une mire déjà trouvée n'est pas comptée deux fois
+
+    if len(trouves) < nbmires : #Repli : recherche dans toute la zone
+        circles = cercles_mires(img[beg1:end1, beg2:end2], nbmires)
+        trouves = [(x + beg2, y + beg1, r) for (x, y, r) in circles]
+    #Triées par position et non par force, pour que les mires de gauche et de droite soient toujours appariées pareil
+    return sorted(trouves, key=lambda mire : (mire[1], mire[0]))
+
+
+@stage("mires")
+def mires(img_input:np.ndarray, draw = False, reduction = 4, workers = 6):
     """Finds the positions of the 8 targets on the unwired PCB, or an error if it could not.
 
+    The targets are first looked for on an image reduced by reduction, which gives the search window of each zone (see
+    fenetres_mires), then each one is refined on a small full resolution patch ; the zones are processed in parallel,
+    and a zone where the patches did not give enough targets is searched on its whole window at full resolution. If the
+    coarse pass does not find the layout of the board, or if the targets found do not match it, the fixed zones
+    (sliceparams) are searched at full resolution instead, as before the coarse pass.
+
     Arguments :
 
     img_input - array of pixels : the working image (in BGR)
 
     draw - bool : whether or not the function should return images of what it is doing.
 
+    reduction - int : the reduction factor of the coarse pass
+
+    workers - int : number of threads processing the zones
+
     Returns : np.ndarray : array of centers
     """
     assert img_input is not None, "file could not be read, check with os.path.exists()" #Vérifier si l'image existe
 
     img = cv.cvtColor(img_input,cv.COLOR_BGR2GRAY) #Mettre en noir et blanc
-    (height,length) = img.shape
 
-    ## TODO : changer cette extraction à la main par quelque chose d'automatisé
-    sliceparams = [(100, 400, 300, 600, 1),  
-                   (-400, -100, 300, 600, 1),
-                   (3800, 4200, 500, 800, 2), 
-                   (100, 400, -600,-300, 1), 
-                   (-400, -100, -600, -300, 1), 
-                   (3800, 4200, -800, -500, 2)]
+    zones, candidats = fenetres_mires(img, reduction)
+    trouves = None
+    if zones is not None :
+        with ThreadPoolExecutor(max_workers=workers) as pool :
+            trouves = list(pool.map(lambda k : mires_zone(img, zones[k], candidats[k]), range(len(zones))))
+        if not disposition_mires([(x, y) for zone in trouves for (x, y, _) in zone], *img.shape) :
+            trouves = None
 
-    cimg = cv.cvtColor(img,cv.COLOR_GRAY2BGR) #Avec 3 canaux pour pouvoir l'afficher bien
+    if trouves is None : #Repli : recherche dans les zones fixes, comme avant la passe grossière
+        zones = fenetres_fixes(*img.shape)
+        with ThreadPoolExecutor(max_workers=workers) as pool :
+            trouves = list(pool.map(lambda k : mires_zone(img, zones[k], []), range(len(zones))))
 
-    centers = []
-
-    for (beg1, end1, beg2, end2, nbmires) in sliceparams :
-        mask = img[beg1:end1, beg2:end2]
-
-        #Blur pour réduire le bruit
-        mask = cv.medianBlur(mask,5)
-        #Fonction qui détecte les cercles. Trouve un seul cercle ou deux à chaque fois en fonction de nbmires
-        circles = cv.HoughCircles(mask,cv.HOUGH_GRADIENT,1,minDist = 100,
-                                    param1=50,param2=20,minRadius=20 ,maxRadius=30)
-
-        if circles is not None:
-            circles = np.int16(np.around(circles))
-            for i in circles[0,:nbmires]:
-                
-                centers.append([i[0]+beg2%length,i[1]+beg1%height])
-
-                #Dessin des cercles
-                if draw :
-                    cv.circle(cimg,(i[0]+beg2%length,i[1]+beg1%height),i[2],(0,255,0),20)
-                    cv.circle(cimg,(i[0]+beg2%length,i[1]+beg1%height),2,(0,0,255),3)
+    centers = [[x, y] for zone in trouves for (x, y, _) in zone]
 
     if draw :
+        cimg = cv.cvtColor(img,cv.COLOR_GRAY2BGR) #Avec 3 canaux pour pouvoir l'afficher bien
+        for zone in trouves :
+            for (x, y, r) in zone :
+                cv.circle(cimg,(int(x),int(y)),int(r),(0,255,0),20)
+                cv.circle(cimg,(int(x),int(y)),2,(0,0,255),3)
+        import matplotlib.pyplot as plt #Chargé seulement quand on dessine
         plt.imshow(cimg)
         plt.show()
 
@@ -66,45 +254,69 @@ def mires(img_input:np.ndarray, draw = False):
 
 
 
+#Régression linéaire par moindres carrés, comme scipy.stats.linregress (qui coûte une seconde d'import à lui seul)
+
+def regression(x, y):
+    """Fits a line y = slope*x + intercept on the given points, with least squares.
+
+    Arguments :
+
+    x, y - np.ndarray : coordinates of the points
+
+    Returns : float, float : the slope and the intercept
+    """
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    dx, dy = x - x.mean(), y - y.mean()
+    slope = np.mean(dx*dy) / np.mean(dx*dx)
+    return slope, y.mean() - slope*x.mean()
+
+
+
 #Détection à la main de la frontière supérieure verte :
 
-def horiz_pcb(img,draw=False) :
+@stage("horiz_pcb")
+def horiz_pcb(img,draw=False,n_samples=1000) :
     """Finds the position of the top and bottom contour of a given PCB.
 
+    Only two bands of 500 columns are sampled, on each side of the center : the green mask is only computed on them.
+
     Arguments :
 
     img - array of pixels : the working image (in BGR)
 
     draw - bool : whether or not the function should return images of what it is doing.
 
+    n_samples - int : number of columns sampled, half in each band (1000 : every column of the bands)
+
     Returns : np.ndarray, np.ndarray, float : The slopes, intercepts of both contours, and the average spacing between top and bottom 
     """
 
     lower_bound = np.array([0, 40, 0])
     upper_bound = np.array([40,110,110])
-    bwimg = cv.inRange(img, lower_bound, upper_bound) #On passe l'image en noir et blanc avec un threshold
-    imagemask_green = cv.medianBlur(bwimg,25) #Uniformisation du tout
 
     middle = img.shape[1]//2
+    offsets = np.around(np.linspace(0, 499, n_samples//2)).astype(np.int64) #Colonnes échantillonnées dans chaque bande de 500
 
-    top_contour = np.zeros((1000,2),dtype=np.int32) #On prend 1000 points au dessus, et 1000 en dessous de la carte
-    bot_contour = np.zeros((1000,2),dtype=np.int32)
+    top_contour = np.zeros((2*len(offsets),2),dtype=np.int32) #On prend n_samples/2 points par bande, au dessus et en dessous de la carte
+    bot_contour = np.zeros((2*len(offsets),2),dtype=np.int32)
 
-    for j in range(middle - 2000, middle - 1500) :
+    for k, start in enumerate([middle - 2000, middle + 1500]) :
+        #La bande est élargie de 12 colonnes de chaque côté, pour que le flou médian (25x25) y soit le même que sur toute l'image
+        left, right = max(start - 12, 0), min(start + 500 + 12, img.shape[1])
+        bwimg = cv.inRange(img[:, left:right], lower_bound, upper_bound) #On passe la bande en noir et blanc avec un threshold
+        imagemask_green = cv.medianBlur(bwimg,25)[:, start + offsets - left] == 255 #Uniformisation du tout
 
-        top_contour[(j - middle + 2000)] = [j,min(np.where(imagemask_green[:,j] == 255)[0])] #Position des premiers et derniers pixels blancs
-        bot_contour[(j - middle + 2000)] = [j,max(np.where(imagemask_green[:,j] == 255)[0])]
+        assert imagemask_green.any(axis=0).all(), "Contour du PCB introuvable"
+        samples = slice(k*len(offsets), (k+1)*len(offsets))
+        top_contour[samples, 0] = bot_contour[samples, 0] = start + offsets
+        top_contour[samples, 1] = np.argmax(imagemask_green, axis=0) #Position des premiers et derniers pixels blancs
+        bot_contour[samples, 1] = img.shape[0] - 1 - np.argmax(imagemask_green[::-1], axis=0)
 
-    for j in range(middle + 1500, middle + 2000) : 
+    top_slope, top_intercept = regression(top_contour[:,0], top_contour[:,1]) #Régressions linéaires des points que l'on vient de trouver
+    bot_slope, bot_intercept = regression(bot_contour[:,0], bot_contour[:,1])
 
-        top_contour[(j - middle-1000)] = [j,min(np.where(imagemask_green[:,j] == 255)[0])] #idem
-        bot_contour[(j - middle-1000)] = [j,max(np.where(imagemask_green[:,j] == 255)[0])]
-
-    top_regress = stats.linregress(top_contour[:,0], top_contour[:,1]) #Régressions linéaires des points que l'on vient de trouver
-    bot_regress = stats.linregress(bot_contour[:,0], bot_contour[:,1])
-
-    slopes = [top_regress.slope, bot_regress.slope] 
-    intercepts = [int(top_regress.intercept), int(bot_regress.intercept)]
+    slopes = [top_slope, bot_slope] 
+    intercepts = [int(top_intercept), int(bot_intercept)]
 
     #écart entre le contour du haut et celui de bas pour trouver l'écart moyen (dilatation)
     spacing = bot_contour[:,1]-top_contour[:,1]
@@ -118,6 +330,7 @@ def horiz_pcb(img,draw=False) :
             cv.circle(img_copy,(top_contour[i][0], top_contour[i][1]),15,(255,0,0),15)
             cv.circle(img_copy,(bot_contour[i][0], bot_contour[i][1]),15,(255,0,0),15)
 
+        import matplotlib.pyplot as plt #Chargé seulement quand on dessine
         plt.imshow(img_copy)
         plt.show()
 
@@ -129,6 +342,7 @@ def horiz_pcb(img,draw=False) :
 
 ## Fonction qui trouve la ligne verticale qui est en théorie le fil de cuivre au centre du pcb
 
+@stage("trouve_ligne")
 def trouve_ligne(img, draw=False):
     """Finds the position of a vertical wire at the center of the PCB.
 
@@ -168,6 +382,7 @@ def trouve_ligne(img, draw=False):
     
             cv.line(img_copy,(x1,y1),(x2,y2),(255,0,0),10)
         
+        import matplotlib.pyplot as plt #Chargé seulement quand on dessine
         plt.imshow(img_copy)
         plt.show()
 
@@ -179,6 +394,7 @@ def trouve_ligne(img, draw=False):
 
 # Fonction qui calcule la matrice de passage et l'origine du repère absolu pour une image donnée
 
+@stage("matrice_psg")
 def matrice_psg(img, draw = False):
     """Returns the transition matrix of a given image from the coordinate system of the image to the 
     transitory coordinate system of the image, as well as the origin of the transitory coordinate system
@@ -223,27 +439,39 @@ def matrice_psg(img, draw = False):
     
 
 
-def mires_cablees(path, draw = False):
+def mires_cablees(path, draw = False, dossier = "ModulePictures"):
     """Finds the positions of the targets on a wired PCB.
 
     Arguments :
 
     path - string : the path to the wired image.
 
-    draw - bool : whether or not the function should return images of what it is doing.
+    draw - bool : whether or not the function should return images of what it is doing (the calibration of the
+    unwired image is then always computed again, to be drawn).
+
+    dossier - string : the folder of the unwired images.
 
     Returns : np.ndarray : array of new centers.
     """
     
     ## Récupération du couple d'images
-    img_cablee = cv.imread(path)
-    img_non_cablee = cv.imread('ModulePictures/' + trouver_la_paire(path,"ModulePictures"))
+    img_cablee = read_image(path)
+    path_non_cablee = os.path.join(dossier, trouver_la_paire(path,dossier))
 
-    ## On trouve le centre des mires sur l'image non câblée
-    centres_mires = mires(img_non_cablee)
+    ## Calibration de l'image non câblée : lue dans le cache si elle a déjà été faite sur cette image
+    calibration = None if draw else lire_calibration(path_non_cablee)
+    if calibration is None :
+        img_non_cablee = read_image(path_non_cablee)
 
-    ## On trouve le repère absolu dans l'image non câblée
-    matrice_passage_init, pt_intersection_init, dilatation_init = matrice_psg(img_non_cablee, draw)
+        ## On trouve le centre des mires sur l'image non câblée
+        centres_mires = mires(img_non_cablee)
+
+        ## On trouve le repère absolu dans l'image non câblée
+        matrice_passage_init, pt_intersection_init, dilatation_init = matrice_psg(img_non_cablee, draw)
+
+        ecrire_calibration(path_non_cablee, centres_mires, matrice_passage_init, pt_intersection_init, dilatation_init)
+    else :
+        centres_mires, matrice_passage_init, pt_intersection_init, dilatation_init = calibration
 
     ## On trouve le repère absolu dans l'image câblée
     matrice_passage_dst, pt_intersection_dst, dilatation_dst = matrice_psg(img_cablee, draw)
@@ -251,13 +479,13 @@ def mires_cablees(path, draw = False):
     ## On calcule la dilatation relative
     dilatation = (dilatation_dst)/dilatation_init
 
-    ## On calcule la position des mires sur la carte câblée à partir du repère absolu (changement de repère x2)
-    nouveaux_centres = []
-    for centre in centres_mires:
-        nouveaux_centres.append(np.dot(np.linalg.inv(matrice_passage_dst),dilatation*np.dot(matrice_passage_init,centre - pt_intersection_init)) + pt_intersection_dst)
+    ## On calcule la position des mires sur la carte câblée à partir du repère absolu (changement de repère x2, en x,y)
+    repere_init = CoordinateFrame(matrice_passage_init, pt_intersection_init)
+    repere_dst = CoordinateFrame(matrice_passage_dst, pt_intersection_dst, dilatation)
+    nouveaux_centres = repere_dst.to_image(repere_init.to_absolute(centres_mires))
 
     ## On arrondit en entiers
-    nouveaux_centres = np.array(nouveaux_centres).astype(np.int16)
+    nouveaux_centres = nouveaux_centres.astype(np.int16)
 
     return nouveaux_centres
 
@@ -265,7 +493,7 @@ def mires_cablees(path, draw = False):
 
 ## Fonction qui renvoie le repère absolu de l'image câblée
 
-def repere_absolu(path, draw = False):
+def repere_absolu(path, draw = False, dossier = "ModulePictures"):
     """Returns the transition matrix to the absolute coordinate system, as well as its origin
     and the dilatation factor.
 
@@ -275,11 +503,13 @@ def repere_absolu(path, draw = False):
 
     draw - bool : whether or not the function should return images of what it is doing.
 
+    dossier - string : the folder of the unwired images.
+
     Returns : np.ndarray, np.ndarray, float
     """
 
     ## Fonction précédente
-    centres = mires_cablees(path, draw)
+    centres = mires_cablees(path, draw, dossier)
 
     ## Dilatation mesurée du ces nouvelles mires
     dilat_measured = 0.5*(np.linalg.norm(centres[0]-centres[5]) + np.linalg.norm(centres[1]-centres[4]))
@@ -291,17 +521,17 @@ def repere_absolu(path, draw = False):
 
     mat_passage = 1/np.sqrt(a**2 + 1) * np.array([[1,-a],[a,1]])
 
-    if draw: afficher_points(cv.imread(path),centres)
+    if draw: afficher_points(read_image(path),centres)
 
     return mat_passage, origine, dilat_measured #Origine renvoyée en x,y
 
 
 
-## Fonction qui trouve les pads sur n'importe quelle image
-## TODO : importer les positions absolues des pads depuis le ficher JSON, et dilat_ref
+## Repère absolu de l'image câblée, sous forme d'objet de changement de repère (points en ligne, colonne)
 
-def find_pads(path, draw=False):
-    """Returns the positions of the pads on any given wired board.
+def cadre_absolu(path, draw = False, dossier = "ModulePictures"):
+    """Returns the absolute coordinate system of a wired image, ready to transform arrays of points in (row, column),
+    e.g. thousands of wire ends from wireEdges : cadre_absolu(path).to_absolute(points).
 
     Arguments :
 
@@ -309,25 +539,42 @@ def find_pads(path, draw=False):
 
     draw - bool : whether or not the function should return images of what it is doing.
 
-    Returns : np.ndarray : array of pads
+    dossier - string : the folder of the unwired images.
+
+    Returns : CoordinateFrame
     """
+    return CoordinateFrame.from_repere(*repere_absolu(path, draw, dossier), board(variante(path)).dilat_ref)
+
 
-    mat, origine, dilat_measured = repere_absolu(path, draw)
 
-    dilatation = dilat_measured/dilat_ref
+## Fonction qui trouve les pads sur n'importe quelle image (positions absolues des pads lues dans la base boards, selon la variante du module)
+
+def find_pads(path, draw=False, dossier = "ModulePictures"):
+    """Returns the positions of the pads on any given wired board.
 
-    #Trouve les pads en inversant la matrice de passage
-    pads_img = np.array([np.dot(np.linalg.inv(mat),dilatation*pads_nouveau_repere[i])+np.flip(np.array([origine,origine]),axis = 1) for i in range(46)]).astype(np.int16)
+    Arguments :
+
+    path - string : the path to the wired image.
+
+    draw - bool : whether or not the function should return images of what it is doing.
+
+    dossier - string : the folder of the unwired images.
+
+    Returns : np.ndarray : array of pads
+    """
 
-    img = cv.imread(path)
+    #Trouve les pads en inversant la matrice de passage, sur les deux coins de tous les pads d'un coup
+    pads_img = cadre_absolu(path, draw, dossier).to_image(board(variante(path)).pads_nouveau_repere).astype(np.int16)
 
     #Dessin des pads
     if draw :
+        img = read_image(path).copy() #Image déjà décodée par repere_absolu
         for pad in pads_img :
             cv.rectangle(img,np.flip(pad[0]),np.flip(pad[1]),(255,0,0),15)
 
         afficher(img)
 
+        import matplotlib.pyplot as plt #Chargé seulement quand on dessine
         plt.imshow(img)
         plt.show()
 
@@ -0,0 +1,54 @@
+import numpy as np
+from functools import cached_property
+
+
+## Changement de repère entre l'image et le repère absolu, appliqué d'un coup à des tableaux de points
+
+class CoordinateFrame :
+    """Transition between the coordinates of an image and an absolute coordinate system :
+
+    absolute = matrix . (image - origin) / dilatation        image = dilatation * matrix^-1 . absolute + origin
+
+    Every transform applies to arrays of any shape ending with 2 : (2,) points, (N, 2) points, (N, 2, 2) rectangles
+    given by two corners... The points must be in the same order (x, y) or (row, column) as the matrix and the origin.
+
+    Arguments :
+
+    matrix - np.ndarray : the 2x2 transition matrix (e.g. from repere_absolu or matrice_psg)
+
+    origin - np.ndarray : the origin of the absolute coordinate system, in image coordinates
+
+    dilatation (optional) - float : the scale of the image relative to the absolute coordinate system
+    """
+
+    def __init__ (self, matrix, origin, dilatation = 1.) :
+        self.matrix = np.asarray(matrix, dtype=np.float64)
+        self.origin = np.asarray(origin, dtype=np.float64)
+        self.dilatation = float(dilatation)
+
+    @classmethod
+    def from_repere (cls, mat, origine, dilat_measured, dilat_ref) :
+        """Builds the frame of a wired image from the output of find_absolute.repere_absolu, for points in (row, column)
+
+        Arguments :
+
+        mat, origine, dilat_measured : the output of repere_absolu (origine being in (x, y))
+
+        dilat_ref - float : the dilatation measured on the reference image
+
+        Returns : CoordinateFrame
+        """
+        return cls(mat, np.flip(np.asarray(origine)), dilat_measured/dilat_ref)
+
+    @cached_property
+    def inverse (self) :
+        """The inverse of the transition matrix, computed once"""
+        return np.linalg.inv(self.matrix)
+
+    def to_absolute (self, points) :
+        """Returns : np.ndarray : the points in the absolute coordinate system (same shape, floats)"""
+        return ((np.asarray(points) - self.origin) @ self.matrix.T) / self.dilatation
+
+    def to_image (self, points) :
+        """Returns : np.ndarray : the points in the coordinates of the image (same shape, floats)"""
+        return self.dilatation * (np.asarray(points) @ self.inverse.T) + self.origin
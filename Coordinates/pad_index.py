@@ -0,0 +1,103 @@
+import numpy as np
+
+
+## Index spatial des pads : une grille régulière dont chaque case connaît les pads qui la touchent (format CSR),
+## pour trouver d'un coup le pad contenant chacun de milliers de points (extrémités des fils de wireEdges par exemple)
+
+class PadIndex :
+    """Spatial index of rectangular pads, answering "which pad contains this point" for many points at once.
+
+    The pads are bucketed in a regular grid : indptr[k]:indptr[k+1] gives the positions in indices of the pads
+    touching the cell k. A query only tests the pads of the cell of each point.
+
+    Arguments :
+
+    pads - array of shape (N, 2, 2) : the pads as pairs of opposite corners in (row, column), both included (e.g. the output of find_pads)
+
+    cell (optional) - int : the size of a cell of the grid in pixels, by default the median size of the pads
+    """
+
+    def __init__ (self, pads, cell = None) :
+        pads = np.asarray(pads, dtype=np.int64).reshape(-1, 2, 2)
+        self.low = pads.min(axis=1) # (row, column) of the top left corners
+        self.high = pads.max(axis=1) # (row, column) of the bottom right corners, included
+        if cell is None :
+            cell = int(np.median(self.high - self.low + 1)) if len(pads) != 0 else 1
+        self.cell = max(int(cell), 1)
+
+        self.origin = self.low.min(axis=0) if len(pads) != 0 else np.zeros(2, dtype=np.int64)
+        first = (self.low - self.origin) // self.cell
+        last = (self.high - self.origin) // self.cell
+        self.shape = last.max(axis=0) + 1 if len(pads) != 0 else np.zeros(2, dtype=np.int64)
+
+        # Every (cell, pad) pair, the cells of a pad being enumerated by offsets in its block of cells
+        spans = last - first + 1
+        counts = spans[:, 0] * spans[:, 1]
+        pad_of_pair = np.repeat(np.arange(len(pads)), counts)
+        offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        rows = first[pad_of_pair, 0] + offset // spans[pad_of_pair, 1]
+        cols = first[pad_of_pair, 1] + offset % spans[pad_of_pair, 1]
+        cells = rows * self.shape[1] + cols
+
+        order = np.lexsort((pad_of_pair, cells))
+        self.indices = pad_of_pair[order]
+        self.indptr = np.searchsorted(cells[order], np.arange(self.shape[0] * self.shape[1] + 1))
+
+    @classmethod
+    def from_zones (cls, zones, width, offset = (0, 0)) :
+        """Builds the index of the pads found by recherche_pads.trouver_pads_chip on a pad strip
+
+        Arguments :
+
+        zones - array of shape (N, 2) : the rows [start, stop) of each pad in the strip
+
+        width - int : the width of the strip (a pad covers all of it)
+
+        offset (optional) - (int, int) : the position (row, column) of the strip in the image, to query in image coordinates
+
+        Returns : PadIndex
+        """
+        zones = np.asarray(zones, dtype=np.int64).reshape(-1, 2)
+        pads = np.zeros((len(zones), 2, 2), dtype=np.int64)
+        pads[:, 0, 0], pads[:, 1, 0] = zones[:, 0], zones[:, 1] - 1
+        pads[:, 1, 1] = width - 1
+        return cls(pads + np.asarray(offset, dtype=np.int64))
+
+    def __len__ (self) :
+        return len(self.low)
+
+    def query (self, points) :
+        """Finds the pad containing each point
+
+        Arguments :
+
+        points - array of shape (M, 2) : the points in (row, column)
+
+        Returns : array of ints : for each point, the index of the pad containing it (the first one if several do), -1 if none
+        """
+        points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+        found = np.full(len(points), -1, dtype=np.int64)
+        cell = (points - self.origin) // self.cell
+        inside = ((points >= self.origin) & (cell < self.shape)).all(axis=1)
+        candidates_of = np.flatnonzero(inside)
+        k = cell[candidates_of, 0] * self.shape[1] + cell[candidates_of, 1]
+
+        # Every (point, candidate pad) pair, then the containment test on all of them at once
+        starts, counts = self.indptr[k], self.indptr[k + 1] - self.indptr[k]
+        point_of_pair = np.repeat(candidates_of, counts)
+        pad_of_pair = self.indices[np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - starts, counts)]
+        contained = ((points[point_of_pair] >= self.low[pad_of_pair]) & (points[point_of_pair] <= self.high[pad_of_pair])).all(axis=1)
+
+        # The pads of a cell are sorted, so the first containing pair of a point is its first pad
+        point_of_pair, pad_of_pair = point_of_pair[contained], pad_of_pair[contained]
+        first = np.flatnonzero(np.diff(point_of_pair, prepend=-1) != 0)
+        found[point_of_pair[first]] = pad_of_pair[first]
+        return found
+
+    def wired (self, points) :
+        """Tells which pads contain at least one of the points
+
+        Returns : array of bools, one per pad
+        """
+        found = self.query(points)
+        return np.bincount(found[found >= 0], minlength=len(self)) > 0
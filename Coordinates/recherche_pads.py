@@ -1,10 +1,9 @@
 ### Imports
 
 import numpy as np
-import pandas as pd
 import cv2 as cv
-import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
+
+from Coordinates.pad_index import PadIndex
 
 
 ### Fonction utile ###
@@ -18,58 +17,69 @@ def norme(pix):
 
 ### Trouver les pads sur la puce ###
 
+# Profil des lignes : moyenne de la norme des pixels de chaque ligne (même calcul que norme, sur toute l'image d'un coup)
+# image : une bande de pads (hauteur, largeur, 3), ou plusieurs bandes de même taille (nombre, hauteur, largeur, 3)
+def profil_lignes(image):
+    pixels=image/255
+    return np.sqrt((pixels*pixels).sum(axis=-1)).mean(axis=-1)
+
+
+# Découpage d'un profil en pads, avec hystérésis : un pad se termine à la première ligne sombre (< 0.8) située au moins
+# 9 lignes après son début (pour ne pas confondre un pad non occupé un peu trop sombre avec une délimitation), et le pad
+# suivant commence à la première ligne claire (> 0.55) qui suit. On s'arrête quand il n'y a plus de délimitation ou
+# plus de ligne claire après la dernière délimitation
+# Sortie : tableau (nombre de pads, 2) des lignes [début, fin) de chaque pad
+def zones_profil(col):
+    sombres=np.flatnonzero(col<0.8)
+    claires=np.flatnonzero(col>0.55)
+    zones=[]
+    checkpoint=0
+    while True:
+        k=np.searchsorted(sombres, checkpoint+9)
+        if k==len(sombres):
+            break
+        fin=sombres[k]
+        zones.append((checkpoint, fin))
+        k=np.searchsorted(claires, fin, side='right')
+        if k==len(claires):
+            break
+        checkpoint=claires[k]
+    return np.array(zones, dtype=np.int64).reshape(-1, 2)
+
+
 # Les trouver
 def trouver_pads_chip(image):
     # Entrée : image cropée contenant uniquement la zone des pads (obtenable grâce au repère absolu de Gabriel)
-    # Sortie : nombre de pads et zones de chaque pads 
+    # Sortie : nombre de pads et zones de chaque pad, comme lignes [début, fin) de l'image (zones[k,0]:zones[k,1])
 
-    pads=0
-    zones=[]
-    i=0
-    cop=image.copy()
-    col=[np.mean([norme(pix) for pix in ligne]) for ligne in cop]
-    checkpoint=0
-    while i<image.shape[0]:
-        if col[i]<0.8 and np.abs(checkpoint-i)>8:      # On a trouvé une délimitation entre deux pads, qu'on ne confondra pas avec un pad non occupé un peu trop sombre
-            
-            zone=[image[checkpoint:i,:,:], [checkpoint, 0]]        # zone et coin sup
-            pads+=1
-            zones.append(zone)
+    zones=zones_profil(profil_lignes(image))
+    return len(zones), zones
 
-            bool=True
 
-            while ((bool) and (i<image.shape[0]-1)):
-                if col[i+1]>0.55:
-                    bool=False
-                    i+=1
-                    checkpoint=i
-                else:
-                    i+=1
-        else:
-            i+=1
+# Les trouver sur toutes les puces d'un coup
+def trouver_pads_chips(images):
+    # Entrée : les bandes de pads de chaque puce, liste d'images ou tableau (nombre, hauteur, largeur, 3)
+    # Sortie : liste des (nombre de pads, zones) de chaque puce, voir trouver_pads_chip
 
-    return pads, zones
+    if len(images)!=0 and len(set(image.shape for image in images))==1:
+        profils=profil_lignes(np.asarray(images))       # toutes les bandes en une seule opération
+    else:
+        profils=[profil_lignes(image) for image in images]
+    return [(len(zones), zones) for zones in map(zones_profil, profils)]
 
 
 
 
 # Trouver si chaque pads est cablé ou non
 def pads_cables(image,liste_points):      
-    # Entrée : image cropée contenant uniquement la zone des pads ; liste des points extremaux à gauche de chaque fil (obtenable grâce aux fonctions de wire.py)
-    # Sortie : liste de 0 et de 1 si pads non cablés ou cablés
+    # Entrée : image cropée contenant uniquement la zone des pads ; liste des points extremaux à gauche de chaque fil (obtenable grâce aux fonctions de wire.py), en (ligne, colonne)
+    # Sortie : liste de 0 et de 1 si pads non cablés ou cablés, "Error" si un point n'est sur aucun pad
+    # Les points n'ont pas besoin d'être triés : chacun est cherché dans l'index des pads
 
     nb_pads,zones=trouver_pads_chip(image)
-    num_pads_cables=[]
-    i,k=0,0
-    while i<nb_pads and k<=len(liste_points):
-        if liste_points[k] in zones[i]:
-            num_pads_cables.append(1)
-            k+=1
-            i+=1
-        else:
-            num_pads_cables.append(0)
-            i+=1
-    if i!=nb_pads or k!=len(liste_points):
+    index=PadIndex.from_zones(zones, image.shape[1])
+    trouves=index.query(liste_points)
+    if (trouves<0).any():
         return "Error"
     else:
-        return num_pads_cables
+        return [int(cable) for cable in index.wired(liste_points)]
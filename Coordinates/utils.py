@@ -1,7 +1,8 @@
 import numpy as np
 import os
 import cv2 as cv
-import matplotlib.pyplot as plt
+
+from Coordinates.catalogue import catalogue
 
 ## Fonction utile pour normaliser un vecteur
 def normalize(v):
@@ -23,20 +24,8 @@ def trouver_la_paire(fichier:str, dossier:str) -> str :
     Returns : str : path to the matching file.
     """
 
-    bname=os.path.basename(fichier)
-    if "After" in bname:
-        name=bname[:bname.find("After")]
-        for f in os.listdir(dossier):
-            if "Reception" in os.path.basename(f):
-                if os.path.basename(f)[:os.path.basename(f).find("Reception")]==name:
-                    return f
-    elif "Reception" in bname:
-        name=bname[:bname.find("Reception")]
-        for f in os.listdir(dossier):
-            if "After" in os.path.basename(f):
-                if os.path.basename(f)[:os.path.basename(f).find("After")]==name:
-                    return f
-    return "Pas de paire"
+    # Le dossier est indexé une seule fois, puis relu seulement s'il a été modifié
+    return catalogue(dossier).paire(fichier)
 
 #fonction utile pour afficher une image
 def afficher(img) :
@@ -56,5 +45,6 @@ def afficher_points(img, centres, with_cv = False):
         cv.waitKey(0)
         cv.destroyAllWindows()
     else:
+        import matplotlib.pyplot as plt #Chargé seulement quand on dessine
         plt.imshow(img_copy)
         plt.show()
\ No newline at end of file
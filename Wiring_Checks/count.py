@@ -1,8 +1,15 @@
 import cv2
-import scipy.signal
+import numpy as np
+from functools import cached_property
+
+from Wiring_Checks.images import read_image
+from Wiring_Checks.profiling import stage
 
 # Theoretical number of wires
 
+WIRES_WITHOUT_IREF = 693 # wires independant of iref
+NB_WIRE_PER_TRIM = [4, 3, 3, 2, 3, 2, 2, 1, 3, 2, 2, 1, 2, 1, 1, 0] # number of wires expected depending on iref
+
 def extract_serial_number (file_name) :
     """Extracts the serial number (starting with 20UPGM) of a module
 
@@ -22,45 +29,60 @@ def extract_serial_number (file_name) :
     assert False, "No serial number found in the file name"
 
 
-def iref_trim (serial_number, data) :
+def iref_trim (serial_number, data = None) :
     """Reads the iref of a module
 
     Arguments :
 
     serial_number - string : serial number of the module
 
-    data - list[dict] : iref of each module
+    data (optional) - list[dict] : iref of each module, by default the modules of registry.modules (indexed lookup)
 
     Returns : (int, int, int, int)
     """
-    ok = False
-    for x in data :
-        if x['serialNumber'] == serial_number :
-            iref = x
-            ok = True
-    assert ok, "Serial number not found"
-    return (iref['IREF_TRIM_1'], iref['IREF_TRIM_2'], iref['IREF_TRIM_3'], iref['IREF_TRIM_4'])
+    if data is None :
+        from Wiring_Checks.registry import modules # lazy : registry imports this module
+        return modules.iref_trim(serial_number)
+    for iref in data :
+        if iref['serialNumber'] == serial_number :
+            return (iref['IREF_TRIM_1'], iref['IREF_TRIM_2'], iref['IREF_TRIM_3'], iref['IREF_TRIM_4'])
+    assert False, "Serial number not found"
 
 
-def expected_wire_number (serial_number, data) :
+def expected_wire_number (serial_number, data = None) :
     """Calculates the theoretical number of wires of a module
 
     Arguments :
 
     serial_number - string : serial number of the module
 
-    data - list[dict] : iref of each module
+    data (optional) - list[dict] : iref of each module, by default the modules of registry.modules
 
     Returns : int
     """
+    if data is None :
+        from Wiring_Checks.registry import modules # lazy : registry imports this module
+        return modules.expected_wire_number(serial_number)
     iref = iref_trim(serial_number, data)
-    nb_wire_per_trim = [4, 3, 3, 2, 3, 2, 2, 1, 3, 2, 2, 1, 2, 1, 1, 0] # number of wires expected depending on iref
-    return (693 + nb_wire_per_trim[iref[0]] + nb_wire_per_trim[iref[1]] + nb_wire_per_trim[iref[2]] + nb_wire_per_trim[iref[3]]) # 693 wires independant of iref + number of iref wires
+    return (WIRES_WITHOUT_IREF + NB_WIRE_PER_TRIM[iref[0]] + NB_WIRE_PER_TRIM[iref[1]] + NB_WIRE_PER_TRIM[iref[2]] + NB_WIRE_PER_TRIM[iref[3]]) # wires independant of iref + number of iref wires
 
 
 # Counting the real number of wires
 
-def crop_ligns (image, level = 0.55) :
+def green_ratio (image) :
+    """Computes the greenness of every row of the picture
+
+    Arguments :
+
+    image - array of pixels : the working image
+
+    Returns : array of floats : the sum of the green channel over the sum of the two others, for each row
+    """
+    return (image[:,:,1].sum(axis=1) / (image[:,:,0].sum(axis=1) + image[:,:,2].sum(axis=1)))
+
+
+@stage("crop_ligns")
+def crop_ligns (image, level = 0.55, green = None) :
     """Determines the limits of the vertical zone of interest of the picture
 
     Arguments :
@@ -69,9 +91,12 @@ def crop_ligns (image, level = 0.55) :
 
     level (optional) - int : limit of greenness before the algorithm stops
 
+    green (optional) - array of floats : the greenness of the rows, if already computed (see green_ratio)
+
     Returns : (int, int)
     """
-    green = image[:,:,1].sum(axis=1) / (image[:,:,0].sum(axis=1) + image[:,:,2].sum(axis=1))
+    if green is None :
+        green = green_ratio(image)
     n = image.shape[0]
 
     limit_high = 0
@@ -89,6 +114,122 @@ def crop_ligns (image, level = 0.55) :
     return (limit_high + 25, limit_low - 22) # +25 and -22 : gaps between the green area and the wire zone
 
 
+def wire_zone (image) :
+    """Determines the rows containing the wires, on both halves of the picture together
+
+    Arguments :
+
+    image - array of pixels or ImageAnalysis : the working image
+
+    Returns : (int, int) : the first and last (excluded) rows of the zone
+    """
+    analysis = ImageAnalysis.of(image)
+    (high_left, low_left), (high_right, low_right) = analysis.lines_left, analysis.lines_right
+    return (min(high_left, high_right), max(low_left, low_right))
+
+
+@stage("find_peaks")
+def find_wire_peaks (signal) :
+    """Finds the wires crossing a line of pixels, as peaks of brightness
+
+    Arguments :
+
+    signal - array of ints : the greyscale values along the line
+
+    Returns : array of int : the positions of the peaks
+    """
+    import scipy.signal # loaded on the first search only : the serial number helpers of this module do not need it
+    peaks, _ = scipy.signal.find_peaks(signal, distance=3, prominence=50, height=190, width=(0,9)) # appropriate parameters were determined with already existing datasets
+    return (peaks)
+
+
+# Batched version : the columns are laid end to end in a single signal, separated by walls of pixels brighter than any
+# real pixel. A wall stops the searches of prominence and width of the peaks around it, so they are the same as on each
+# column alone. The distance criterion is the only one depending on the other peaks, and with equal heights its result
+# depends on the sorting order of scipy : the few columns where it may remove a peak are therefore computed alone.
+_WALL = 8
+_WALL_VALUE = 1000
+
+def find_wire_peaks_columns (image_grey_crop, columns) :
+    """Finds the peaks of several columns at once, with the same result as find_wire_peaks on each of them
+
+    Arguments :
+
+    image_grey_crop - array of pixels : the working greyscale image, cropped vertically
+
+    columns - array of ints : the columns of interest
+
+    Returns :
+
+    index - array of ints : for each peak, its column as an index in columns
+
+    rows - array of ints : for each peak, its row
+    """
+    columns = np.asarray(columns)
+    height = image_grey_crop.shape[0]
+    step = height + _WALL
+    signal = np.full((len(columns), step), _WALL_VALUE, dtype=np.int16)
+    signal[:, _WALL:] = image_grey_crop[:, columns].T
+    signal = np.append(signal.ravel(), np.full(_WALL, _WALL_VALUE, dtype=np.int16))
+
+    import scipy.signal # see find_wire_peaks
+    with stage("find_peaks") :
+        # same criteria and order as find_wire_peaks, the walls being dropped before the costly ones
+        peaks, _ = scipy.signal.find_peaks(signal, height=190)
+        peaks = peaks[signal[peaks] < _WALL_VALUE]
+        index = peaks // step
+        close = (np.diff(peaks) < 3) & (index[1:] == index[:-1])
+        alone = np.unique(index[1:][close]) # columns where the distance criterion may remove a peak
+        peaks = peaks[~np.isin(index, alone)]
+        prominences, left_bases, right_bases = scipy.signal.peak_prominences(signal, peaks)
+        kept = prominences >= 50
+        peaks, prominence_data = peaks[kept], (prominences[kept], left_bases[kept], right_bases[kept])
+        widths = scipy.signal.peak_widths(signal, peaks, prominence_data=prominence_data)[0]
+        peaks = peaks[(0 <= widths) & (widths <= 9)]
+
+    index, rows = np.divmod(peaks, step)
+    index, rows = [index], [rows - _WALL]
+    for i in alone :
+        exact = find_wire_peaks(image_grey_crop[:, columns[i]])
+        index.append(np.full(len(exact), i, dtype=np.int64))
+        rows.append(exact)
+    index, rows = np.concatenate(index), np.concatenate(rows)
+    order = np.lexsort((rows, index))
+    return (index[order], rows[order])
+
+
+def count_columns (image_grey_crop, columns) :
+    """Counts the number of wires in several columns at once, see count
+
+    Arguments :
+
+    image_grey_crop - array of pixels : the working greyscale image, cropped vertically
+
+    columns - array of ints : the columns of interest
+
+    Returns : array of ints
+    """
+    index, _ = find_wire_peaks_columns(image_grey_crop, columns)
+    return (np.bincount(index, minlength=len(columns)))
+
+
+def _first_column_reaching (image_grey_crop, columns, level, block = 16, max_block = 512) :
+    """Galloping search of the first column (in the given order) with at least level wires : the columns are counted by
+    blocks, the size of the blocks doubling each time, so that the many columns far from the wire zone cost few calls.
+
+    Returns : int : the index in columns of the first column reaching level, None if there is none
+    """
+    start = 0
+    while start < len(columns) :
+        counts = count_columns(image_grey_crop, columns[start:start + block])
+        reached = np.flatnonzero(counts >= level)
+        if len(reached) != 0 :
+            return (start + int(reached[0]))
+        start += block
+        block = min(2 * block, max_block)
+    return (None)
+
+
 def count (image_grey_crop, column) :
     """Count the number of wires in a specific column
 
@@ -100,10 +241,109 @@ def count (image_grey_crop, column) :
 
     Returns : int
     """
-    peaks, _ = scipy.signal.find_peaks(image_grey_crop[:,column], distance=3, prominence=50, height=190, width=(0,9)) # appropriate parameters were determined with already existing datasets
-    return (peaks.shape[0])
+    return (find_wire_peaks(image_grey_crop[:,column]).shape[0])
+
+
+def link_peaks (index, rows, n_columns, tolerance = 2, gap = 1) :
+    """Follows the wires from column to column : each peak continues the wire whose last peak is the nearest one, if it is
+    at most tolerance rows away, the nearest pairs being linked first and a wire taking at most one peak per column. The
+    other peaks start new wires. Linking only consecutive peaks keeps close and slanted wires apart, which a grouping of
+    all the peaks by row would chain together.
+
+    Arguments :
+
+    index, rows - arrays of ints : for each peak, its column (as an index in the band) and its row, sorted by column
+
+    n_columns - int : number of columns of the band
+
+    tolerance (optional) - int : maximal gap in rows between two consecutive peaks of the same wire
+
+    gap (optional) - int : number of consecutive columns where a wire may be missing (glare) and still be continued
+
+    Returns : array of ints : for each peak, the number of its wire
+    """
+    wire = np.full(len(rows), -1, dtype=np.int64)
+    last_rows = np.zeros(0, dtype=np.int64) # last peak of each wire
+    last_columns = np.zeros(0, dtype=np.int64)
+    bounds = np.searchsorted(index, np.arange(n_columns + 1))
+
+    for j in range(n_columns) :
+        peaks = np.arange(bounds[j], bounds[j+1])
+        active = np.flatnonzero(last_columns >= j - 1 - gap)
+        if len(active) != 0 and len(peaks) != 0 :
+            # Candidates : for each peak, the active wires just above and just below it
+            active = active[np.argsort(last_rows[active], kind='stable')]
+            position = np.searchsorted(last_rows[active], rows[peaks])
+            candidates = np.concatenate([position - 1, position])
+            peak = np.concatenate([peaks, peaks])
+            valid = (candidates >= 0) & (candidates < len(active))
+            peak, candidate = peak[valid], active[candidates[valid]]
+            distance = np.abs(rows[peak] - last_rows[candidate])
+            close = distance <= tolerance
+            peak, candidate, distance = peak[close], candidate[close], distance[close]
+
+            taken = set()
+            for k in np.argsort(distance, kind='stable') :
+                if wire[peak[k]] == -1 and candidate[k] not in taken :
+                    wire[peak[k]] = candidate[k]
+                    taken.add(candidate[k])
+
+        new = peaks[wire[peaks] == -1]
+        wire[new] = len(last_rows) + np.arange(len(new))
+        last_rows = np.append(last_rows, np.zeros(len(new), dtype=np.int64))
+        last_columns = np.append(last_columns, np.zeros(len(new), dtype=np.int64))
+        last_rows[wire[peaks]] = rows[peaks]
+        last_columns[wire[peaks]] = j
+
+    return wire
+
+
+def consensus_peaks (image_grey_crop, column, band = 9, tolerance = 2, quorum = 0.5) :
+    """Finds the wires on a band of columns around a column, rather than on this column alone : the peaks of every column
+    of the band are found at once, then followed from column to column (each peak continues the wire whose last peak is
+    the nearest, within tolerance rows, and a wire has at most one peak per column), and a wire is kept if it was found
+    in more than quorum of the columns. A glare spot or a bent wire on one column thus no longer changes the count.
+
+    Arguments :
+
+    image_grey_crop - array of pixels : the working greyscale image, cropped vertically
+
+    column - int : the central column of the band
+
+    band (optional) - int : number of columns of the band (cut at the edges of the image)
 
+    tolerance (optional) - int : maximal gap in rows between two consecutive peaks of the same wire
+
+    quorum (optional) - float : minimal fraction of the columns in which a wire must be found
+
+    Returns :
+
+    rows - array of ints : for each wire, its row on the column of the band nearest to the central one where it was found
+
+    cols - array of ints : for each wire, that column (so that (rows, cols) is a pixel of the wire)
+
+    confidence - array of floats : for each wire, the fraction of the columns of the band in which it was found
+    """
+    columns = np.arange(max(column - band//2, 0), min(column + band - band//2, image_grey_crop.shape[1]))
+    index, rows = find_wire_peaks_columns(image_grey_crop, columns)
 
+    wire = link_peaks(index, rows, len(columns), tolerance)
+    n = wire.max() + 1 if len(wire) != 0 else 0
+
+    # Number of columns supporting each wire (at most one peak per column)
+    confidence = np.bincount(wire, minlength=n) / len(columns)
+
+    # Representative peak of each wire : the one nearest to the central column
+    distance = np.abs(columns[index] - column)
+    nearest = np.lexsort((distance, wire))
+    first = nearest[np.flatnonzero(np.diff(wire[nearest], prepend=-1))]
+
+    kept = confidence > quorum
+    order = np.argsort(rows[first][kept], kind='stable')
+    return (rows[first][kept][order], columns[index[first]][kept][order], confidence[kept][order])
+
+
+@stage("crop_columns_left")
 def crop_columns_left (image_grey_crop, level = 100) :
     """Determines the left limit of the wire zone
 
@@ -116,14 +356,11 @@ def crop_columns_left (image_grey_crop, level = 100) :
     Returns : int
     """
     n = image_grey_crop.shape[1]
-    left = 0
-    count_left = count(image_grey_crop, left)
-    while (count_left < level) and (left < n) :
-        left += 1
-        count_left = count(image_grey_crop, left)
-    return (left)
+    left = _first_column_reaching(image_grey_crop, np.arange(n), level)
+    return (n - 1 if left is None else left)
 
 
+@stage("crop_columns_right")
 def crop_columns_right (image_grey_crop, level = 100) :
     """Determines the right limit of the wire zone
 
@@ -136,24 +373,93 @@ def crop_columns_right (image_grey_crop, level = 100) :
     Returns : int
     """
     n = image_grey_crop.shape[1]
-    right = n - 1
-    count_right = count(image_grey_crop, right)
-    while (count_right < level) and (right > 0) :
-        right -= 1
-        count_right = count(image_grey_crop, right)
-    return (right)
+    index = _first_column_reaching(image_grey_crop, np.arange(n - 1, -1, -1), level)
+    return (0 if index is None else n - 1 - index)
+
+
+# Derived arrays of an image, computed once
+
+class ImageAnalysis :
+    """Analysis context of one image : every intermediate result (greyscale image, greenness of the rows, limits of the
+    wire zone...) is computed the first time it is needed, then kept. It can be given instead of the image to every
+    function of count.py and wire.py, so that a full check computes each of them exactly once.
+
+    Arguments :
+
+    image - array of pixels : the working image (BGR)
+    """
+
+    def __init__ (self, image) :
+        self.image = image
+        self.shape = image.shape
+
+    @classmethod
+    def of (cls, image) :
+        """Returns : ImageAnalysis : the given analysis, or a new one if an image is given"""
+        return image if isinstance(image, ImageAnalysis) else cls(image)
+
+    def __getitem__ (self, key) :
+        return self.image[key]
+
+    @cached_property
+    def grey (self) :
+        return cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
+
+    @cached_property
+    def green_left (self) :
+        return green_ratio(self.image[:,:self.shape[1]//2])
+
+    @cached_property
+    def green_right (self) :
+        return green_ratio(self.image[:,self.shape[1]//2:])
+
+    @cached_property
+    def lines_left (self) :
+        """(int, int) : the vertical limits of the wire zone on the left half"""
+        return crop_ligns(self.image[:,:self.shape[1]//2], green=self.green_left)
+
+    @cached_property
+    def lines_right (self) :
+        """(int, int) : the vertical limits of the wire zone on the right half"""
+        return crop_ligns(self.image[:,self.shape[1]//2:], green=self.green_right)
+
+    @cached_property
+    def grey_left (self) :
+        """The greyscale image, cropped to the wire zone of the left half"""
+        high, low = self.lines_left
+        return self.grey[high:low]
+
+    @cached_property
+    def grey_right (self) :
+        """The greyscale image, cropped to the wire zone of the right half"""
+        high, low = self.lines_right
+        return self.grey[high:low]
+
+    @cached_property
+    def column_left (self) :
+        """int : the left limit of the wire zone"""
+        return crop_columns_left(self.grey_left)
+
+    @cached_property
+    def column_right (self) :
+        """int : the right limit of the wire zone"""
+        return crop_columns_right(self.grey_right)
 
 
 # Final fonctions
 
-def test_wire_number (file_name, data) :
+def test_wire_number (file_name, data = None, analysis = None, band = 1) :
     """Tests whether the number of wires on a module is correct or not
 
     Arguments :
 
     file_name - string : name of the file (the image must be in the same folder as this programm)
 
-    data - list[dict] : iref of each module
+    data (optional) - list[dict] : iref of each module, by default the modules of registry.modules
+
+    analysis (optional) - ImageAnalysis : the analysis of the image, if already started
+
+    band (optional) - int : number of columns on which the wires are counted, see consensus_peaks (a single one by default)
 
     Returns : 
     test - bool : True if the number of wires is correct, False otherwise
@@ -162,18 +468,16 @@ def test_wire_number (file_name, data) :
     """
     expected_nb = expected_wire_number(extract_serial_number(file_name), data)
 
-    image = cv2.imread(file_name)
-    n = image.shape[1]
-
-    high_left, low_left = crop_ligns(image[:,:n//2])
-    high_right, low_right = crop_ligns(image[:,n//2:])
-    grey = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    left = crop_columns_left(grey[high_left:low_left])
-    right = crop_columns_right(grey[high_right:low_right])
+    if analysis is None :
+        analysis = ImageAnalysis(read_image(file_name))
 
-    real_nb_left = count(grey[high_left:low_left], column = left+35) # +35 : gap between the left limit of the wire zone and the column with every wires
-    real_nb_right = count(grey[high_right:low_right], column = right-35) # -35 : gap between the right limit of the wire zone and the column with every wires
-    real_nb = real_nb_left + real_nb_right
+    if band > 1 :
+        rows_left, _, _, rows_right, _, _ = wire_consensus(analysis, band)
+        real_nb = len(rows_left) + len(rows_right)
+    else :
+        real_nb_left = count(analysis.grey_left, column = analysis.column_left+35) # +35 : gap between the left limit of the wire zone and the column with every wires
+        real_nb_right = count(analysis.grey_right, column = analysis.column_right-35) # -35 : gap between the right limit of the wire zone and the column with every wires
+        real_nb = real_nb_left + real_nb_right
     test = expected_nb == real_nb
 
     return (test, expected_nb, real_nb)
@@ -184,7 +488,7 @@ def wire_pos (image) :
 
     Arguments :
 
-    image - array of pixels : the working image
+    image - array of pixels or ImageAnalysis : the working image
 
     Returns :
     
@@ -196,32 +500,55 @@ def wire_pos (image) :
 
     real_right - int : the abscissa of the wires on the right side (same for all wires)
     """
-    n = image.shape[1]
+    analysis = ImageAnalysis.of(image)
+    (high_left, _), (high_right, _) = analysis.lines_left, analysis.lines_right
+    left, right = analysis.column_left, analysis.column_right
 
-    high_left, low_left = crop_ligns(image[:,:n//2])
-    high_right, low_right = crop_ligns(image[:,n//2:])
-    grey = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    left = crop_columns_left(grey[high_left:low_left])
-    right = crop_columns_right(grey[high_right:low_right])
-
-    peaks_left, _ = scipy.signal.find_peaks(grey[high_left:low_left, left+35], distance=3, prominence=50, height=190, width=(0,9)) # +35 : gap between the left limit of the wire zone and the column with every wires
-    peaks_right, _ = scipy.signal.find_peaks(grey[high_right:low_right, right-35], distance=3, prominence=50, height=190, width=(0,9)) # -35 : gap between the right limit of the wire zone and the column with every wires
+    peaks_left = find_wire_peaks(analysis.grey_left[:, left+35]) # +35 : gap between the left limit of the wire zone and the column with every wires
+    peaks_right = find_wire_peaks(analysis.grey_right[:, right-35]) # -35 : gap between the right limit of the wire zone and the column with every wires
     real_peaks_left, real_left, real_peaks_right, real_right = peaks_left + high_left, left+35, peaks_right + high_right, right-35 # returning to the coordinates on the original picture
 
     return(real_peaks_left, real_left, real_peaks_right, real_right)
 
-def test_wire_finding (file_name) :
+
+def wire_consensus (image, band = 9) :
+    """Gives the position of every wire detected on a band of columns, with the confidence of each one, see consensus_peaks
+
+    Arguments :
+
+    image - array of pixels or ImageAnalysis : the working image
+
+    band (optional) - int : number of columns of the bands around left+35 and right-35
+
+    Returns :
+
+    rows_left, cols_left - arrays of ints : a pixel of each wire on the left side (coordinates on the original picture)
+
+    confidence_left - array of floats : the fraction of the columns in which each wire on the left side was found
+
+    rows_right, cols_right, confidence_right - the same on the right side
+    """
+    analysis = ImageAnalysis.of(image)
+    (high_left, _), (high_right, _) = analysis.lines_left, analysis.lines_right
+    rows_left, cols_left, confidence_left = consensus_peaks(analysis.grey_left, analysis.column_left+35, band)
+    rows_right, cols_right, confidence_right = consensus_peaks(analysis.grey_right, analysis.column_right-35, band)
+    return (rows_left + high_left, cols_left, confidence_left, rows_right + high_right, cols_right, confidence_right)
+
+def test_wire_finding (file_name, analysis = None) :
     """Tests the wire finding algorithm by creating a test image with the detected wires marked by a black pixel
 
     Arguments :
 
     file_name - string : name of the file (the image must be in the same folder as this programm)
 
+    analysis (optional) - ImageAnalysis : the analysis of the image, if already started
+
     Returns : None
     """
-    image = cv2.imread(file_name)
-    image2 = image.copy()
-    test_left, left, test_right, right = wire_pos(image)
+    if analysis is None :
+        analysis = ImageAnalysis(read_image(file_name))
+    image2 = analysis.image.copy()
+    test_left, left, test_right, right = wire_pos(analysis)
     for x in test_left :
         image2[x, left] = [0, 0, 0]
     for x in test_right :
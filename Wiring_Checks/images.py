@@ -0,0 +1,50 @@
+import cv2
+import os
+
+from Wiring_Checks.profiling import stage
+
+# Every image is decoded once per run and per resolution, then shared : (absolute path, reduction) -> image
+_decoded = {}
+
+# Reduced modes of OpenCV : the JPEG decoder directly produces an image 2, 4 or 8 times smaller, which is much faster
+# than a full decode, but not than resizing an image already decoded at full resolution (the preview uses them). OpenCV
+# cannot decode a region of interest only : a crop of the image always costs the decode of the whole image.
+_reduced_modes = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+def read_image (path, reduction = 1) :
+    """Decodes an image (in BGR), only the first time it is asked for
+
+    The returned array is shared between all the callers and is therefore read-only : copy it before drawing on it.
+
+    Arguments :
+
+    path - string : path to the image
+
+    reduction (optional) - int : 1 for the full resolution, 2, 4 or 8 for a reduced one (for stages only needing coarse geometry)
+
+    Returns : array of pixels
+    """
+    assert reduction in _reduced_modes, "The reduction must be 1, 2, 4 or 8"
+    key = (os.path.abspath(path), reduction)
+    if key not in _decoded :
+        with stage("decode") :
+            image = cv2.imread(path, _reduced_modes[reduction])
+        assert image is not None, "file could not be read, check with os.path.exists()"
+        image.setflags(write=False)
+        _decoded[key] = image
+    return _decoded[key]
+
+
+def forget_images (path = None) :
+    """Frees the decoded images, of one file or of all of them
+
+    Arguments :
+
+    path (optional) - string : path to the image, all the images by default
+    """
+    if path is None :
+        _decoded.clear()
+    else :
+        for key in [key for key in _decoded if key[0] == os.path.abspath(path)] :
+            del _decoded[key]
@@ -0,0 +1,273 @@
+import numpy as np
+import scipy.ndimage
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from Wiring_Checks.mask import WhiteMask, white_mask
+from Wiring_Checks.profiling import stage
+
+# Same neighbourhood as the BFS of wire.py : up, down, left and right, no diagonals
+FOUR_CONNECTIVITY = np.array([[0,1,0],
+                              [1,1,1],
+                              [0,1,0]], dtype=bool)
+
+
+@stage("labeling")
+def label_white (image, threshold = 100000, rows = None) :
+    """Labels every white connected component of an image in a single pass
+
+    Arguments :
+
+    image - array of pixels, count.ImageAnalysis or WhiteMask : the working image, or its precomputed mask
+
+    threshold (optional) - float : arbitrary threshold, see mask.white_mask (ignored if a WhiteMask is given)
+
+    rows (optional) - (int, int) : only the rows start:stop are labeled, the others are left as background
+
+    Returns :
+
+    labels - array of int32 : the label of each pixel, 0 for the background
+
+    sizes - array of int : the number of pixels of each label (sizes[0] is set to 0)
+    """
+    mask = WhiteMask.of(image, threshold)
+    start, stop = (0, mask.shape[0]) if rows is None else rows
+    labels = np.zeros(mask.shape, dtype=np.int32)
+    n = scipy.ndimage.label(mask.rows(start, stop).unpack(), structure=FOUR_CONNECTIVITY, output=labels[start:stop])
+    sizes = np.bincount(labels.ravel(), minlength=n+1)
+    sizes[0] = 0
+    return (labels, sizes)
+
+
+def group_seeds (labels, rows, cols) :
+    """Finds the component of every seed, and which seeds fall in the same component
+
+    Arguments :
+
+    labels - array of ints : the label image given by label_white
+
+    rows, cols - arrays of ints : the coordinates of the seeds
+
+    Returns :
+
+    seed_labels - array of ints : the label of each seed (0 if the seed is not white)
+
+    shared - dict {int : array of ints} : for every label reached by several seeds, the indices of those seeds
+    """
+    seed_labels = labels[rows, cols]
+    ids, inverse, counts = np.unique(seed_labels, return_inverse=True, return_counts=True)
+    order = np.argsort(inverse, kind="stable")
+    groups = np.split(order, np.cumsum(counts)[:-1]) # indices of the seeds of each label, in the order of ids
+    shared = {int(label) : group for label, group, n in zip(ids, groups, counts) if label > 0 and n > 1}
+    return (seed_labels, shared)
+
+
+
+# Tile-parallel labeling : every tile is labeled by its own process, the labels are then merged across the seams
+
+_shared = {} # arrays in shared memory, attached once per worker process
+
+
+def _attach (image_spec, labels_spec) :
+    """Initializer of the worker processes : attaches the image and the label image from shared memory"""
+    for key, (name, shape, dtype) in [("image", image_spec), ("labels", labels_spec)] :
+        memory = shared_memory.SharedMemory(name=name)
+        _shared[key + "_memory"] = memory # keeps the memory alive as long as the worker
+        _shared[key] = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+
+
+def _label_tile (tile, threshold) :
+    """Labels one tile (r0, r1, c0, c1) of the shared image into the shared label image
+
+    Returns : (int, array of ints) : the number of labels of the tile, and for each of them the raster index of its first pixel
+    """
+    r0, r1, c0, c1 = tile
+    tile_labels = _shared["labels"][r0:r1, c0:c1]
+    n = scipy.ndimage.label(white_mask(_shared["image"][r0:r1, c0:c1], threshold), structure=FOUR_CONNECTIVITY, output=tile_labels)
+    return (n, _first_pixels(tile_labels, r0, c0, _shared["labels"].shape[1]))
+
+
+def _first_pixels (tile_labels, r0, c0, width) :
+    """Returns : array of ints : for each label of a tile starting at (r0, c0), the raster index of its first pixel in an image of the given width"""
+    flat = tile_labels.ravel()
+    pixels = np.flatnonzero(flat)
+    _, first = np.unique(flat[pixels], return_index=True) # the raster order of the tile is the one of the whole image
+    rows, cols = np.divmod(pixels[first], tile_labels.shape[1])
+    return ((r0 + rows) * width + c0 + cols)
+
+
+def _find (parent, x) :
+    while parent[x] != x :
+        parent[x] = parent[parent[x]]
+        x = parent[x]
+    return x
+
+
+def merge_seams (labels, first, seams) :
+    """Merges the labels of adjacent tiles with a union-find, and renumbers them in the order a single pass would
+
+    Arguments :
+
+    labels - array of int32 : the label image, with labels unique across tiles (modified in place)
+
+    first - array of ints : the raster index of the first pixel of each label, first[0] being ignored
+
+    seams - list of (array of ints, array of ints) : pairs of neighbouring lines of pixels on both sides of a seam
+
+    Returns : int : the number of labels after merging
+    """
+    lookup, n = seam_lookup(first, seams)
+    labels[...] = lookup[labels]
+    return n
+
+
+def seam_lookup (first, seams) :
+    """Computes the renumbering of merge_seams without applying it, for label images too big to be renumbered at once
+
+    Returns : (array of int32, int) : the new label of each old label, and the number of labels after merging
+    """
+    parent = np.arange(len(first))
+    for side_a, side_b in seams :
+        touching = (side_a > 0) & (side_b > 0)
+        for a, b in np.unique(np.stack([side_a[touching], side_b[touching]], axis=1), axis=0) :
+            root_a, root_b = _find(parent, a), _find(parent, b)
+            if root_a != root_b :
+                parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    # pointer jumping, so that every label points directly to its root
+    while True :
+        grand_parent = parent[parent]
+        if (grand_parent == parent).all() :
+            break
+        parent = grand_parent
+
+    # a merged component is numbered after its first pixel, like scipy.ndimage.label does
+    root_first = np.full(len(first), np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(root_first, parent[1:], np.asarray(first[1:], dtype=np.int64))
+    roots = np.flatnonzero(root_first[1:] < np.iinfo(np.int64).max) + 1
+    new_ids = np.zeros(len(first), dtype=np.int32)
+    new_ids[roots[np.argsort(root_first[roots], kind="stable")]] = np.arange(1, len(roots) + 1, dtype=np.int32)
+    lookup = new_ids[parent]
+    lookup[0] = 0
+    return (lookup, len(roots))
+
+
+@stage("labeling")
+def label_white_tiled (image, threshold = 100000, rows = None, tile_shape = (1024, 1024), workers = None) :
+    """Same result as label_white, with the work split into tiles labeled in parallel by a pool of processes.
+
+    The rows of interest of the image are copied once in shared memory, every process labels its tiles in a
+    label image also in shared memory, and the labels of the components crossing the seams are merged afterwards.
+
+    Arguments :
+
+    image - array of pixels : the working image
+
+    threshold (optional) - float : arbitrary threshold, see mask.white_mask
+
+    rows (optional) - (int, int) : only the rows start:stop are labeled (typically the wire zone, see count.wire_zone)
+
+    tile_shape (optional) - (int, int) : number of rows and columns of a tile
+
+    workers (optional) - int : number of processes, all the cores by default
+
+    Returns : the same (labels, sizes) as label_white
+    """
+    start, stop = (0, image.shape[0]) if rows is None else rows
+    zone = image[start:stop]
+    height, width = zone.shape[:2]
+    tiles = [(r, min(r + tile_shape[0], height), c, min(c + tile_shape[1], width))
+             for r in range(0, height, tile_shape[0]) for c in range(0, width, tile_shape[1])]
+
+    image_memory = shared_memory.SharedMemory(create=True, size=max(zone.nbytes, 1))
+    labels_memory = shared_memory.SharedMemory(create=True, size=max(height * width * 4, 1))
+    try :
+        shared_zone = np.ndarray(zone.shape, dtype=zone.dtype, buffer=image_memory.buf)
+        shared_zone[...] = zone
+        zone_labels = np.ndarray((height, width), dtype=np.int32, buffer=labels_memory.buf)
+
+        specs = ((image_memory.name, zone.shape, zone.dtype), (labels_memory.name, (height, width), np.int32))
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_attach, initargs=specs) as pool :
+            results = list(pool.map(_label_tile, tiles, [threshold] * len(tiles)))
+
+        # labels made unique across tiles
+        first = [np.zeros(1, dtype=np.int64)]
+        offset = 0
+        for (r0, r1, c0, c1), (n, tile_first) in zip(tiles, results) :
+            tile_labels = zone_labels[r0:r1, c0:c1]
+            tile_labels[tile_labels > 0] += offset
+            first.append(tile_first)
+            offset += n
+
+        seams = [(zone_labels[:, c - 1], zone_labels[:, c]) for c in range(tile_shape[1], width, tile_shape[1])]
+        seams += [(zone_labels[r - 1, :], zone_labels[r, :]) for r in range(tile_shape[0], height, tile_shape[0])]
+        n = merge_seams(zone_labels, np.concatenate(first), seams)
+
+        labels = np.zeros(image.shape[:2], dtype=np.int32)
+        labels[start:stop] = zone_labels
+        del shared_zone, zone_labels
+    finally :
+        for memory in (image_memory, labels_memory) :
+            memory.close()
+            memory.unlink()
+
+    sizes = np.bincount(labels.ravel(), minlength=n+1)
+    sizes[0] = 0
+    return (labels, sizes)
+
+
+
+# Strip labeling : the rows are labeled by strips, one after the other, the labels being carried over from a strip to
+# the next one through their common seam
+
+@stage("labeling")
+def label_white_strips (image, threshold = 100000, rows = None, strip = 256, labels = None) :
+    """Same labels as label_white, computed strip by strip so that only one strip of the image is read at a time
+    (e.g. from a memory-mapped image, see streaming.RawStore)
+
+    Arguments :
+
+    image - array of pixels : the working image, typically memory-mapped
+
+    threshold (optional) - float : arbitrary threshold, see mask.white_mask
+
+    rows (optional) - (int, int) : only the rows start:stop are labeled
+
+    strip (optional) - int : number of rows of a strip
+
+    labels (optional) - array of int32 : where to write the labels, of shape (stop - start, width), e.g. a memory-mapped
+    file (see numpy.lib.format.open_memmap) ; a new array by default
+
+    Returns :
+
+    labels - array of int32 : the label of each pixel of the rows start:stop only (row 0 is the row start)
+
+    sizes - array of int : the number of pixels of each label (sizes[0] is set to 0)
+    """
+    start, stop = (0, image.shape[0]) if rows is None else rows
+    width = image.shape[1]
+    if labels is None :
+        labels = np.zeros((stop - start, width), dtype=np.int32)
+    strips = [(r, min(r + strip, stop)) for r in range(start, stop, strip)]
+
+    first = [np.zeros(1, dtype=np.int64)]
+    seams = []
+    offset = 0
+    for r0, r1 in strips :
+        strip_labels = labels[r0 - start:r1 - start]
+        n = scipy.ndimage.label(white_mask(image[r0:r1], threshold), structure=FOUR_CONNECTIVITY, output=strip_labels)
+        first.append(_first_pixels(strip_labels, r0 - start, 0, width))
+        strip_labels[strip_labels > 0] += offset
+        offset += n
+        if r0 > start :
+            seams.append((np.array(labels[r0 - start - 1]), np.array(strip_labels[0]))) # only the seam is kept in memory
+
+    lookup, n = seam_lookup(np.concatenate(first), seams)
+    sizes = np.zeros(n + 1, dtype=np.int64)
+    for r0, r1 in strips :
+        strip_labels = labels[r0 - start:r1 - start]
+        strip_labels[...] = lookup[strip_labels]
+        sizes += np.bincount(strip_labels.ravel(), minlength=n+1)
+    sizes[0] = 0
+    return (labels, sizes)
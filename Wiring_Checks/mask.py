@@ -0,0 +1,94 @@
+import numpy as np
+import weakref
+
+
+def white_mask (image, threshold = 100000) :
+    """Thresholds a whole image at once, with the same criterion as wire.isWhite (squared norm of the pixel above the threshold)
+
+    Arguments :
+
+    image - array of pixels : the working image
+
+    threshold (optional) - float : arbitrary threshold
+
+    Returns : array of bools, one per pixel
+    """
+    dtype = np.int32 if np.issubdtype(image.dtype, np.integer) else np.float64 # int32 is enough for 3 * 255**2
+    squared_norm = np.zeros(image.shape[:2], dtype=dtype)
+    for channel in range(3) :
+        layer = image[:,:,channel].astype(dtype)
+        squared_norm += layer * layer
+    return squared_norm > threshold
+
+
+class WhiteMask :
+    """Whiteness of every pixel of an image, computed once and stored as a packed array of bits (8 pixels per byte).
+
+    It can be given instead of the image to every function of wire.py, and to crop_efficace.croper.
+
+    Arguments :
+
+    image - array of pixels : the working image
+
+    threshold (optional) - float : arbitrary threshold, see white_mask
+    """
+
+    _cache = {} # (id of the image, threshold) -> (weak reference to the image, mask)
+
+    def __init__ (self, image = None, threshold = 100000, packed = None, width = None) :
+        self.threshold = threshold
+        if packed is None :
+            packed = np.packbits(white_mask(image, threshold), axis=1)
+            width = image.shape[1]
+        self.packed = packed
+        self.shape = (packed.shape[0], width)
+
+    @classmethod
+    def of (cls, image, threshold = 100000) :
+        """Gives the mask of an image, building it only the first time it is asked for a given image and threshold
+
+        Arguments :
+
+        image - array of pixels, count.ImageAnalysis or WhiteMask : the working image (a WhiteMask is returned as is)
+
+        threshold (optional) - float : arbitrary threshold
+
+        Returns : WhiteMask
+        """
+        if isinstance(image, WhiteMask) :
+            return image
+        image = getattr(image, "image", image) # the image of an ImageAnalysis
+        key = (id(image), threshold)
+        cached = cls._cache.get(key)
+        if cached is not None and cached[0]() is image :
+            return cached[1]
+        mask = cls(image, threshold)
+        cls._cache[key] = (weakref.ref(image, lambda _ : cls._cache.pop(key, None)), mask)
+        return mask
+
+    def __len__ (self) :
+        return self.shape[0]
+
+    def __getitem__ (self, coord) :
+        """Whiteness of the pixel at coord = (row, column)"""
+        row, col = coord
+        return bool((self.packed[row, col >> 3] >> (7 - (col & 7))) & 1)
+
+    def rows (self, start, stop) :
+        """Mask of the rows start:stop, sharing the memory of this one
+
+        Returns : WhiteMask
+        """
+        return WhiteMask(threshold=self.threshold, packed=self.packed[start:stop], width=self.shape[1])
+
+    def crop (self, rows, cols) :
+        """Mask of image[rows, cols], for any slices rows and cols (steps included)
+
+        Returns : WhiteMask
+        """
+        cropped = np.unpackbits(self.packed[rows], axis=1, count=self.shape[1])[:, cols]
+        return WhiteMask(threshold=self.threshold, packed=np.packbits(cropped, axis=1), width=cropped.shape[1])
+
+    def unpack (self) :
+        """Returns : array of bools, one per pixel"""
+        return np.unpackbits(self.packed, axis=1, count=self.shape[1]).view(bool)
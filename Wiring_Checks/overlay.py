@@ -0,0 +1,124 @@
+import numpy as np
+import cv2
+import os
+
+from Wiring_Checks.profiling import stage
+
+
+@stage("output")
+def overlay_pieces (wires, margin = 50, budget = None) :
+    """Splits the bounding box of every wire in horizontal pieces, small enough for the overlay and the thumbnail of a
+    piece (4 and 3 bytes per pixel, the thumbnail with its margin) to fit in the memory budget
+
+    Arguments :
+
+    wires - list of Wire : the wires to highlight
+
+    margin (optional) - int : number of pixels kept around a wire in its thumbnail
+
+    budget (optional) - int : peak memory allowed to a piece, in bytes (a single piece per wire if None)
+
+    Returns : list of (int, int, int) : the wire, first row and last row (included) of each piece
+    """
+    pieces = []
+    for k, wire in enumerate(wires) :
+        r0, c0, r1, c1 = wire.bbox
+        step = r1 - r0 + 1 if budget is None else max(1, budget // (7 * (c1 - c0 + 1 + 2*margin)) - 2*margin)
+        pieces += [(k, a, min(a + step, r1 + 1) - 1) for a in range(r0, r1 + 1, step)]
+    return pieces
+
+
+@stage("output")
+def write_overlay (output, image, wires, preview = None, composite = False, margin = 50, color = (0, 0, 255), budget = None) :
+    """Saves the highlighted wires without re-encoding the whole image :
+
+    - output/overlay.npz : sparse mask (shape of the image, rows and columns of the highlighted pixels, bounding boxes,
+      and for each overlay its wire and its offset (row, column) in the image)
+    - output/overlay_<k>.png : transparent overlay of the k-th highlighted wire, cropped to its bounding box
+    - output/contact_<k>.jpg : thumbnail around the k-th highlighted wire
+
+    With a memory budget, a wire too big for it is split in several pieces (see overlay_pieces) : k then numbers the
+    pieces, and the npz gives the wire of each of them.
+    - output/preview.jpg : low resolution image of the whole module, with the highlighted regions framed
+    - output/result.jpg : the full resolution image with the wires painted, only if composite is True
+
+    Arguments :
+
+    output - string : the folder in which the files are written (created if needed, the overlays and thumbnails of a
+    previous run being removed)
+
+    image - array of pixels : the working image (BGR), it is not modified
+
+    wires - list of Wire : the wires to highlight
+
+    preview (optional) - array of pixels : a reduced version of the image (e.g. images.read_image(path, 8)), no preview if None
+
+    composite (optional) - bool : whether or not to also write the full resolution image
+
+    margin (optional) - int : number of pixels kept around a wire in its thumbnail
+
+    color (optional) - (int, int, int) : color of the highlighted pixels (BGR)
+
+    budget (optional) - int : peak memory allowed to an overlay and its thumbnail, in bytes (no limit if None)
+
+    Returns : list of strings : the paths of the written files
+    """
+    os.makedirs(output, exist_ok=True)
+    for name in os.listdir(output) :
+        if (name.startswith("contact_") and name.endswith(".jpg")) or (name.startswith("overlay") and name.endswith(".png")) :
+            os.remove(os.path.join(output, name))
+    written = []
+    height, width = image.shape[:2]
+    rows = np.concatenate([wire.rows for wire in wires]) if len(wires) != 0 else np.zeros(0, dtype=np.int32)
+    cols = np.concatenate([wire.cols for wire in wires]) if len(wires) != 0 else np.zeros(0, dtype=np.int32)
+    bboxes = np.array([wire.bbox for wire in wires], dtype=np.int32).reshape(-1, 4)
+
+    # Sparse mask, and one overlay per wire (or piece of wire) restricted to its bounding box : two distant wires never
+    # make an overlay as big as the image
+    pieces = overlay_pieces(wires, margin, budget)
+    offsets = np.array([(a, wires[k].bbox[1]) for (k, a, _) in pieces], dtype=np.int32).reshape(-1, 2)
+    path = os.path.join(output, "overlay.npz")
+    np.savez_compressed(path, shape=np.array([height, width]), rows=rows, cols=cols, bboxes=bboxes,
+                        pieces=np.array([k for (k, _, _) in pieces], dtype=np.int32), offsets=offsets)
+    written.append(path)
+
+    for i, (k, a, b) in enumerate(pieces) :
+        wire = wires[k]
+        _, c0, _, c1 = wire.bbox
+        inside = (wire.rows >= a) & (wire.rows <= b)
+        wire_rows, wire_cols = wire.rows[inside], wire.cols[inside]
+
+        overlay = np.zeros((b - a + 1, c1 - c0 + 1, 4), dtype=np.uint8)
+        overlay[wire_rows - a, wire_cols - c0] = (*color, 255)
+        path = os.path.join(output, "overlay_" + str(i) + ".png")
+        cv2.imwrite(path, overlay)
+        written.append(path)
+        del overlay
+
+        # Thumbnail
+        t0, u0, t1, u1 = max(a - margin, 0), max(c0 - margin, 0), min(b + margin + 1, height), min(c1 + margin + 1, width)
+        thumbnail = np.array(image[t0:t1, u0:u1])
+        thumbnail[wire_rows - t0, wire_cols - u0] = color
+        path = os.path.join(output, "contact_" + str(i) + ".jpg")
+        cv2.imwrite(path, thumbnail)
+        written.append(path)
+
+    # Preview of the whole module
+    if preview is not None :
+        preview = preview.copy()
+        scale = preview.shape[0] / height
+        for (r0, c0, r1, c1) in bboxes :
+            cv2.rectangle(preview, (int(c0 * scale), int(r0 * scale)), (int(c1 * scale) + 1, int(r1 * scale) + 1), color, 2)
+        path = os.path.join(output, "preview.jpg")
+        cv2.imwrite(path, preview)
+        written.append(path)
+
+    # Full resolution image, only on request
+    if composite :
+        copy = image.copy()
+        copy[rows, cols] = color
+        path = os.path.join(output, "result.jpg")
+        cv2.imwrite(path, copy)
+        written.append(path)
+
+    return written
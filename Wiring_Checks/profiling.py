@@ -0,0 +1,117 @@
+import cProfile
+import json
+import os
+import threading
+from functools import wraps
+from time import perf_counter, time
+
+# Wall time and number of calls of every stage of the pipeline : name -> [calls, seconds]
+_stages = {}
+_lock = threading.Lock()
+
+
+class stage :
+    """Records the wall time and the number of calls of a stage of the pipeline.
+
+    Can be used as a decorator (@stage("crop_ligns")) or as a context manager (with stage("decode") : ...).
+    Nested stages are all recorded, each with its own inclusive time.
+
+    Arguments :
+
+    name - string : the name of the stage
+    """
+
+    def __init__ (self, name) :
+        self.name = name
+
+    def __enter__ (self) :
+        self.start = perf_counter()
+        return self
+
+    def __exit__ (self, *exception) :
+        record(self.name, perf_counter() - self.start)
+
+    def __call__ (self, function) :
+        @wraps(function)
+        def timed (*args, **kwargs) :
+            with stage(self.name) :
+                return function(*args, **kwargs)
+        return timed
+
+
+def record (name, seconds) :
+    """Adds one call of a stage
+
+    Arguments :
+
+    name - string : the name of the stage
+
+    seconds - float : the wall time spent in this call
+    """
+    with _lock :
+        calls_and_time = _stages.setdefault(name, [0, 0.])
+        calls_and_time[0] += 1
+        calls_and_time[1] += seconds
+
+
+def reset_stages () :
+    """Forgets every recorded stage, to be called before working on a new image"""
+    with _lock :
+        _stages.clear()
+
+
+def stage_report (image) :
+    """Gives the recorded stages as a dict, ready to be dumped as JSON
+
+    Arguments :
+
+    image - string : the path of the image they were recorded for
+
+    Returns : dict
+    """
+    with _lock :
+        stages = {name : {"calls" : calls, "seconds" : round(seconds, 6)} for name, (calls, seconds) in sorted(_stages.items())}
+    return {"image" : image, "timestamp" : time(), "stages" : stages}
+
+
+def write_stage_report (path, image) :
+    """Writes the recorded stages of an image in a JSON file
+
+    Arguments :
+
+    path - string : the JSON file
+
+    image - string : the path of the image they were recorded for
+    """
+    with open(path, "w") as f :
+        json.dump(stage_report(image), f, indent=4)
+
+
+def run_instrumented (image, function, *args, profile = False, **kwargs) :
+    """Runs one step of the pipeline on an image and writes its timings next to the working directory :
+    <image name>_timings.json, and <image name>.prof (cProfile data, readable with pstats or snakeviz) if profile is True
+
+    Arguments :
+
+    image - string : the path of the working image
+
+    function - callable : the function to run, called with *args and **kwargs
+
+    profile (optional) - bool : whether or not to also run cProfile
+
+    Returns : the result of the function
+    """
+    name = os.path.splitext(os.path.basename(image))[0]
+    reset_stages()
+    profiler = cProfile.Profile() if profile else None
+    if profiler is not None :
+        profiler.enable()
+    try :
+        with stage("total") :
+            result = function(*args, **kwargs)
+    finally :
+        if profiler is not None :
+            profiler.disable()
+            profiler.dump_stats(name + ".prof")
+        write_stage_report(name + "_timings.json", image)
+    return result
@@ -0,0 +1,107 @@
+import ast
+import json
+import os
+import numpy as np
+
+from Wiring_Checks.count import NB_WIRE_PER_TRIM, WIRES_WITHOUT_IREF
+
+_folder = os.path.dirname(os.path.abspath(__file__))
+
+# The later files complete or replace the records of the earlier ones
+DEFAULT_FILES = [os.path.join(_folder, "iref_trim_per_module.json"), os.path.join(_folder, "iref_trim_per_module_v2.json")]
+
+TRIM_KEYS = ['IREF_TRIM_1', 'IREF_TRIM_2', 'IREF_TRIM_3', 'IREF_TRIM_4']
+
+
+class ModuleRegistry :
+    """IREF trims and rework data of every module, indexed by serial number.
+
+    The JSON files are only read on the first lookup, and read again only when one of them has been modified since.
+
+    Arguments :
+
+    files (optional) - list of strings : the JSON files to merge, by default the v1 and v2 files of this folder
+    """
+
+    def __init__ (self, files = None) :
+        self.files = list(DEFAULT_FILES if files is None else files)
+        self._mtimes = None
+        self._records = {}
+        self._index = {}
+        self._trims = np.zeros((0, 4), dtype=np.int64)
+
+    def _refresh (self) :
+        """Loads the files if they were never loaded or if one of them changed"""
+        mtimes = [os.path.getmtime(path) if os.path.exists(path) else None for path in self.files]
+        if mtimes == self._mtimes :
+            return
+        records = {}
+        for path in self.files :
+            if os.path.exists(path) :
+                with open(path, "r") as f :
+                    for record in json.load(f) :
+                        records.setdefault(record['serialNumber'], {}).update(record)
+        self._records = records
+        self._index = {serial : i for i, serial in enumerate(records)}
+        self._trims = np.array([[record[key] for key in TRIM_KEYS] for record in records.values()], dtype=np.int64).reshape(-1, 4)
+        self._mtimes = mtimes
+
+    def _row (self, serial_number) :
+        self._refresh()
+        assert serial_number in self._index, "Serial number not found"
+        return self._index[serial_number]
+
+    def __contains__ (self, serial_number) :
+        self._refresh()
+        return serial_number in self._index
+
+    def __len__ (self) :
+        self._refresh()
+        return len(self._index)
+
+    def record (self, serial_number) :
+        """Returns : dict : the merged record of a module"""
+        self._row(serial_number)
+        return self._records[serial_number]
+
+    def iref_trim (self, serial_number) :
+        """Reads the iref of a module
+
+        Returns : (int, int, int, int)
+        """
+        row = self._row(serial_number)
+        return tuple(int(trim) for trim in self._trims[row])
+
+    def reworked_wire_bonds (self, serial_number) :
+        """Reads the rework data of a module (only in the v2 file)
+
+        Returns : list : e.g. [None], ['2'] or ['few (1-5)'], None if the module has no rework data
+        """
+        value = self.record(serial_number).get('REWORKED_WIRE_BONDS')
+        return None if value is None else ast.literal_eval(value)
+
+    def expected_wire_number (self, serial_number) :
+        """Calculates the theoretical number of wires of a module
+
+        Returns : int
+        """
+        row = self._row(serial_number)
+        return WIRES_WITHOUT_IREF + int(np.asarray(NB_WIRE_PER_TRIM)[self._trims[row]].sum())
+
+    def expected_wire_numbers (self, serial_numbers) :
+        """Calculates the theoretical number of wires of several modules at once
+
+        Arguments :
+
+        serial_numbers - list of strings : serial numbers of the modules
+
+        Returns : array of ints
+        """
+        self._refresh()
+        assert all(serial_number in self._index for serial_number in serial_numbers), "Serial number not found"
+        rows = np.array([self._index[serial_number] for serial_number in serial_numbers], dtype=np.int64)
+        return WIRES_WITHOUT_IREF + np.asarray(NB_WIRE_PER_TRIM)[self._trims[rows]].sum(axis=1)
+
+
+# Registry shared by the whole program
+modules = ModuleRegistry()
@@ -0,0 +1,257 @@
+import cv2
+import numpy as np
+import os
+import re
+import tempfile
+from functools import cached_property
+from numpy.lib.format import open_memmap
+
+from Wiring_Checks.count import extract_serial_number, green_ratio, wire_zone, ImageAnalysis
+from Wiring_Checks.labeling import label_white_strips, group_seeds
+from Wiring_Checks.wire import Wire, contactGraph, isTouching, printReport, seedWires, uncertainWires
+from Wiring_Checks.images import read_image
+from Wiring_Checks.overlay import write_overlay
+from Wiring_Checks.profiling import stage
+from Wiring_Checks.registry import modules
+
+# Default peak memory allowed to the strips, in bytes
+DEFAULT_BUDGET = 256 * 2**20
+
+# Memory used per pixel of a strip while it is processed : the pixels (3), the squared norm and one channel in int32
+# (8), the mask (1) and the labels (4)
+_BYTES_PER_PIXEL = 16
+
+
+class RawStore :
+    """Decoded pixels of an image, kept in a raw .npy file and memory-mapped : the image is decoded once, the later
+    runs only map the file, and only the strips being read are loaded in memory (and can be evicted by the system).
+
+    The raw file is named after the image, its size and its modification time, so a modified image is decoded again.
+    It weighs as much as the decoded image : close removes it once the image is no longer needed.
+
+    Arguments :
+
+    path - string : path to the image
+
+    folder (optional) - string : the folder of the raw files, by default "wiring_raw" in the temporary folder
+    """
+
+    def __init__ (self, path, folder = None) :
+        self.folder = os.path.join(tempfile.gettempdir(), "wiring_raw") if folder is None else folder
+        os.makedirs(self.folder, exist_ok=True)
+        name = os.path.splitext(os.path.basename(path))[0]
+        status = os.stat(path)
+        self.raw = os.path.join(self.folder, name + "_" + str(status.st_size) + "_" + str(int(status.st_mtime)) + ".npy")
+        if not os.path.exists(self.raw) :
+            self._decode(path, name)
+        self.pixels = np.load(self.raw, mmap_mode="r")
+        self.shape = self.pixels.shape
+
+    def _decode (self, path, name) :
+        """Decodes the image in the raw file, and removes the raw files of the older versions of the image"""
+        with stage("decode") :
+            image = cv2.imread(path, cv2.IMREAD_COLOR) # OpenCV has no strip decoder : this is the only time the whole image is in memory
+        assert image is not None, "file could not be read, check with os.path.exists()"
+        # a temporary file of its own : two processes decoding the same image never write to the same file
+        descriptor, temporary = tempfile.mkstemp(dir=self.folder, suffix=".part.npy")
+        os.close(descriptor)
+        try :
+            raw = open_memmap(temporary, mode="w+", dtype=image.dtype, shape=image.shape)
+            raw[...] = image
+            raw.flush()
+            del raw, image
+            os.replace(temporary, self.raw)
+        except BaseException :
+            os.remove(temporary)
+            raise
+        versions = re.compile(re.escape(name) + r"_\d+_\d+\.npy") # the raw files of this image only, not of X_NOK for X
+        for other in os.listdir(self.folder) :
+            if versions.fullmatch(other) and os.path.join(self.folder, other) != self.raw :
+                try :
+                    os.remove(os.path.join(self.folder, other))
+                except OSError : # already removed by another process, or still mapped by one
+                    pass
+
+    def close (self) :
+        """Unmaps the raw file and removes it (kept if another process is still using it, on systems that forbid it)"""
+        self.pixels = None
+        try :
+            os.remove(self.raw)
+        except OSError :
+            pass
+
+    def strip_rows (self, budget = DEFAULT_BUDGET) :
+        """Returns : int : the number of rows of a strip fitting in the memory budget (in bytes)"""
+        return max(1, budget // (self.shape[1] * _BYTES_PER_PIXEL))
+
+    def strips (self, budget = DEFAULT_BUDGET, rows = None) :
+        """Gives the bounds of the strips covering the rows start:stop (all of them by default)
+
+        Returns : list of (int, int)
+        """
+        start, stop = (0, self.shape[0]) if rows is None else rows
+        strip = self.strip_rows(budget)
+        return [(r, min(r + strip, stop)) for r in range(start, stop, strip)]
+
+
+class StripAnalysis (ImageAnalysis) :
+    """ImageAnalysis of a memory-mapped image, whose intermediate results are computed strip by strip : the greenness
+    of the rows, then the greyscale image of the wire zones only (the full greyscale image is never built).
+
+    Arguments :
+
+    store - RawStore : the decoded image
+
+    budget (optional) - int : peak memory allowed to a strip, in bytes
+    """
+
+    def __init__ (self, store, budget = DEFAULT_BUDGET) :
+        super().__init__(store.pixels)
+        self.store = store
+        self.budget = budget
+
+    def _green (self, cols) :
+        return np.concatenate([green_ratio(self.image[r0:r1, cols]) for r0, r1 in self.store.strips(self.budget)])
+
+    def _grey_band (self, rows) :
+        high, low = rows
+        band = np.empty((max(low - high, 0), self.shape[1]), dtype=np.uint8)
+        for r0, r1 in self.store.strips(self.budget, (high, low)) :
+            band[r0 - high:r1 - high] = cv2.cvtColor(np.ascontiguousarray(self.image[r0:r1]), cv2.COLOR_BGR2GRAY)
+        return band
+
+    @cached_property
+    def green_left (self) :
+        return self._green(slice(None, self.shape[1]//2))
+
+    @cached_property
+    def green_right (self) :
+        return self._green(slice(self.shape[1]//2, None))
+
+    @cached_property
+    def grey (self) :
+        raise AttributeError("the full greyscale image is not built in streaming mode, use grey_left and grey_right")
+
+    @cached_property
+    def grey_left (self) :
+        return self._grey_band(self.lines_left)
+
+    @cached_property
+    def grey_right (self) :
+        return self.grey_left if self.lines_right == self.lines_left else self._grey_band(self.lines_right)
+
+
+def wires_from_strips (labels, ids, start = 0, strip = 256) :
+    """Same wires as wire.Wire.fromLabels, the label image being read strip by strip
+
+    Arguments :
+
+    labels - array of ints : the labels of the rows start:stop (see labeling.label_white_strips), typically memory-mapped
+
+    ids - array of ints : the labels of interest (0 is ignored)
+
+    start (optional) - int : the row of the image of the first row of labels
+
+    strip (optional) - int : number of rows of a strip
+
+    Returns : dict {int : Wire}
+    """
+    parts = {}
+    for r0 in range(0, labels.shape[0], strip) :
+        for label, wire in Wire.fromLabels(np.asarray(labels[r0:r0 + strip]), ids).items() :
+            parts.setdefault(label, []).append(Wire(wire.rows + start + r0, wire.cols))
+    return {label : Wire.concatenate(wires) for label, wires in parts.items()}
+
+
+@stage("output")
+def write_composite_strips (path, store, wires, budget = DEFAULT_BUDGET, color = (0, 0, 255)) :
+    """Writes the full resolution image with the wires painted, copied strip by strip in a memory-mapped file
+    (the JPEG encoder still reads it as a whole, but from the page cache)
+
+    Arguments :
+
+    path - string : the file written
+
+    store - RawStore : the decoded image
+
+    wires - list of Wire : the wires to paint
+
+    budget (optional) - int : peak memory allowed to a strip, in bytes
+
+    color (optional) - (int, int, int) : color of the painted pixels (BGR)
+    """
+    wire = Wire.concatenate(wires)
+    order = np.argsort(wire.rows, kind="stable")
+    rows, cols = wire.rows[order], wire.cols[order]
+    with tempfile.TemporaryDirectory(dir=store.folder) as folder :
+        copy = open_memmap(os.path.join(folder, "composite.npy"), mode="w+", dtype=store.pixels.dtype, shape=store.shape)
+        for r0, r1 in store.strips(budget) :
+            copy[r0:r1] = store.pixels[r0:r1]
+            first, last = np.searchsorted(rows, [r0, r1])
+            copy[rows[first:last], cols[first:last]] = color
+        cv2.imwrite(path, copy)
+        del copy
+
+
+def analyseWiresStreaming (filename, budget = DEFAULT_BUDGET, output = "result", composite = False, band = 1, folder = None, keep_raw = False) :
+    """Same check as wire.analyseWires, with the image read by horizontal strips from a memory-mapped raw file : the
+    memory used by the analysis is bounded by the budget (plus the greyscale image of the wire zone, one byte per pixel).
+    The image must be decoded first, and OpenCV decodes it whole : when the raw file does not exist yet (always, unless
+    a previous run kept it with keep_raw), the peak memory of the run is that of the full decoded image. The overlays
+    and thumbnails of a wire too big for the budget are written in several pieces, see overlay.write_overlay.
+
+    Arguments :
+
+    filename - str : the file name of the working image
+
+    budget - int : peak memory allowed to a strip, in bytes
+
+    output - str : the folder where the highlighted wires are saved
+
+    composite - bool : whether or not to also save the full resolution image with the wires painted (slow)
+
+    band - int : number of columns on which the wires are detected, see count.consensus_peaks
+
+    folder - str : the folder of the raw files, see RawStore
+
+    keep_raw - bool : whether or not to keep the raw file of the image for the next runs, which then stay within the
+    budget (removed at the end by default, the file weighing as much as the decoded image)
+
+    Returns : int, int, list : the number of wires expected, the number of wires detected, and the contact groups (see wire.contactGraph)
+    """
+    store = RawStore(filename, folder)
+    try :
+        return _analyse_store(filename, store, budget, output, composite, band)
+    finally :
+        if not keep_raw :
+            store.close()
+
+
+def _analyse_store (filename, store, budget, output, composite, band) :
+    """Body of analyseWiresStreaming, on an opened RawStore"""
+    analysis = StripAnalysis(store, budget)
+    n_expected = modules.expected_wire_number(extract_serial_number(filename))
+    seeds_rows, seeds_cols, confidence = seedWires(analysis, band)
+    n_detected = len(seeds_rows)
+
+    # The labels of the wire zone are written in a memory-mapped file, strip by strip
+    zone = wire_zone(analysis)
+    strip = store.strip_rows(budget)
+    with tempfile.TemporaryDirectory(dir=store.folder) as labels_folder :
+        labels = open_memmap(os.path.join(labels_folder, "labels.npy"), mode="w+", dtype=np.int32, shape=(zone[1] - zone[0], store.shape[1]))
+        labels, sizes = label_white_strips(store.pixels, rows=zone, strip=strip, labels=labels)
+        wire_labels, shared = group_seeds(labels, seeds_rows - zone[0], seeds_cols)
+        wires = wires_from_strips(labels, wire_labels, zone[0], strip)
+        del labels
+
+    contacts = contactGraph(shared, wires, seeds_rows, seeds_cols)
+    alone = np.setdiff1d(wire_labels[wire_labels > 0], list(shared))
+    oversized = alone[isTouching(sizes[alone])]
+
+    touching = [wires[group["component"]] for group in contacts]
+    write_overlay(output, store.pixels, touching, read_image(filename, 8), budget=budget)
+    if composite :
+        write_composite_strips(os.path.join(output, "result.jpg"), store, touching, budget)
+    printReport(n_expected, n_detected, contacts, [wires[label] for label in oversized], uncertainWires(seeds_rows, seeds_cols, confidence))
+
+    return n_expected, n_detected, contacts
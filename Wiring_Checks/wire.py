@@ -1,16 +1,14 @@
 import numpy as np
-import cv2
-import matplotlib.pyplot as plt
 from collections import deque
-import json
-from time import time
+from functools import cached_property
 
-from Wiring_Checks.count import expected_wire_number, extract_serial_number, wire_pos
-
-# open the json with the iref for each module
-
-with open("Wiring_Checks/iref_trim_per_module.json", "r") as f:
-    data = json.load(f)
+from Wiring_Checks.count import extract_serial_number, wire_pos, wire_consensus, wire_zone, ImageAnalysis
+from Wiring_Checks.labeling import label_white, label_white_tiled, group_seeds
+from Wiring_Checks.mask import WhiteMask
+from Wiring_Checks.images import read_image
+from Wiring_Checks.overlay import write_overlay
+from Wiring_Checks.profiling import stage
+from Wiring_Checks.registry import modules
 
 # Utils functions for analyzing pixels in general
 
@@ -25,45 +23,136 @@ def norm(pix: np.ndarray) -> float:
     return float(pix[0])**2 + float(pix[1])**2 + float(pix[2])**2
 
 
-def isWhite(img: np.ndarray, coord: tuple, threshold = 100000) -> bool:
+def isWhite(img, coord: tuple, threshold = 100000) -> bool:
     """Tests whether or not a pixel is considered white, using an arbitrary threshold.
 
     Arguments :
 
-    img - array of pixels : the working image
+    img - array of pixels, ImageAnalysis or WhiteMask : the working image, or its precomputed mask
 
     coord - tuple of ints : the coordinates of the pixel
 
-    threshold - float : arbitrary threshold
+    threshold - float : arbitrary threshold (ignored if a WhiteMask is given)
 
     Returns : bool
     """
+    if isinstance(img, WhiteMask):
+        return img[coord]
+    if isinstance(img, ImageAnalysis):
+        img = img.image
     return norm(img[coord[0],coord[1],:]) > threshold
 
 
-def validCoord(img: np.ndarray, coord: tuple) -> bool:
+def validCoord(img, coord: tuple) -> bool:
     """Tests whether or not the coordinates are within the boundaries of the image.
 
     Arguments :
 
-    img - array of pixels : the working image
+    img - array of pixels, ImageAnalysis or WhiteMask : the working image
 
     coord - tuple of ints : the coordinates of the working pixel
 
     Returns : bool
     """
-    return 0 <= coord[0] and coord[0] < len(img) and 0 <= coord[1] and coord[1] < len(img[0])
+    return 0 <= coord[0] and coord[0] < img.shape[0] and 0 <= coord[1] and coord[1] < img.shape[1]
+
+
+
+# Compact representation of a wire
+
+class Wire:
+    """The pixels of a wire, stored as two arrays of int32 (rows and columns) instead of a list of tuples.
+
+    The size, bounding box and edges are computed once, on first access.
+
+    Arguments :
+
+    rows - array of ints : the rows of the pixels
+
+    cols - array of ints : the columns of the pixels, in the same order
+    """
+
+    def __init__(self, rows, cols):
+        self.rows = np.asarray(rows, dtype=np.int32)
+        self.cols = np.asarray(cols, dtype=np.int32)
+
+    @classmethod
+    def fromCoords(cls, coords: list):
+        """Builds a wire from a list of (row, column) tuples.
+
+        Returns : Wire
+        """
+        coords = np.array(coords, dtype=np.int32).reshape(-1, 2)
+        return cls(coords[:,0], coords[:,1])
+
+    @classmethod
+    def fromLabels(cls, labels: np.ndarray, ids) -> dict:
+        """Builds the wires of several components of a label image at once, their pixels being in raster order.
+
+        Arguments :
+
+        labels - array of ints : the label image given by labeling.label_white
+
+        ids - array of ints : the labels of interest (0 is ignored)
+
+        Returns : dict {int : Wire}
+        """
+        wanted = np.unique(np.asarray(ids))
+        wanted = wanted[wanted > 0]
+        flat = labels.ravel()
+        pixels = np.flatnonzero(flat)
+        pixels = pixels[np.isin(flat[pixels], wanted)]
+        pixels = pixels[np.argsort(flat[pixels], kind="stable")]
+        bounds = np.searchsorted(flat[pixels], wanted, side="right")
+        rows, cols = np.divmod(pixels, labels.shape[1])
+        return {int(label) : cls(rows[start:stop], cols[start:stop]) for label, start, stop in zip(wanted, np.r_[0, bounds[:-1]], bounds)}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return zip(self.rows.tolist(), self.cols.tolist())
+
+    @property
+    def size(self) -> int:
+        return len(self.rows)
+
+    @cached_property
+    def bbox(self) -> tuple:
+        """Returns : (int, int, int, int) : first row, first column, last row, last column (included)"""
+        return (int(self.rows.min()), int(self.cols.min()), int(self.rows.max()), int(self.cols.max()))
+
+    @cached_property
+    def edges(self) -> tuple:
+        """Returns : tuple of coordinates : the first leftmost and the first rightmost pixels"""
+        i_left, i_right = int(np.argmin(self.cols)), int(np.argmax(self.cols))
+        return ((int(self.rows[i_left]), int(self.cols[i_left])), (int(self.rows[i_right]), int(self.cols[i_right])))
+
+    def paint(self, img: np.ndarray, color):
+        """Colors every pixel of the wire in img, in a single fancy-indexing assignment."""
+        img[self.rows, self.cols] = color
+
+    @staticmethod
+    def concatenate(wires: list):
+        """Merges several wires into one.
+
+        Returns : Wire
+        """
+        wires = list(wires)
+        if len(wires) == 0:
+            return Wire([], [])
+        return Wire(np.concatenate([wire.rows for wire in wires]), np.concatenate([wire.cols for wire in wires]))
 
 
 
 # Intermediate functions for the Breadth-First Search (BFS) wire recognition function
 
-def neighboursList(img: np.ndarray, coord: tuple) -> list:
+def neighboursList(img, coord: tuple) -> list:
     """Creates the list of coordinates of the neighbouring white pixels given the current pixel.
 
     Arguments :
 
-    img - array of pixels : the working image
+    img - array of pixels, ImageAnalysis or WhiteMask : the working image, or its precomputed mask
 
     coord - tuple of ints : the coordinates of the current pixel
 
@@ -78,131 +167,220 @@ def neighboursList(img: np.ndarray, coord: tuple) -> list:
     return neighbours_list
 
 
-def visit(img: np.ndarray, coord: tuple, wire: list,queue: deque):
+def visit(img, coord: tuple, seen: set,queue: deque):
     """Visits (i.e. adds to the visiting queue) all the unvisited neighbouring white pixels given the current pixel.
 
     Arguments :
 
-    img - array of pixels : the working image
+    img - array of pixels, ImageAnalysis or WhiteMask : the working image, or its precomputed mask
 
     coord - tuple of ints : the coordinates of the current pixel
 
-    wire - list of coordinates : the list of pixels already visited
+    seen - set of coordinates : the pixels already visited or queued, updated with the new ones
 
     queue - deque of coordinates : the visiting queue
     """
     neighbours_list = neighboursList(img,coord)
     for neighbour in neighbours_list:
-        if (neighbour not in wire) and (neighbour not in queue):
+        if neighbour not in seen:
+            seen.add(neighbour)
             queue.append(neighbour)
 
 
 
 # Breadth-First Search (BFS) wire recognition function
 
-def bfsWire(img: np.ndarray, start_coord: tuple) -> list:
-    """Creates the list of coordinates of all the pixels of a wire given a starting pixel, using a Breadth-First Search (BFS) algorithm.
+@stage("bfs")
+def bfsWire(img, start_coord: tuple) -> Wire:
+    """Finds all the pixels of a wire given a starting pixel, using a Breadth-First Search (BFS) algorithm.
 
     Arguments : 
 
-    img - array of pixels : the working image
+    img - array of pixels, ImageAnalysis or WhiteMask : the working image, or its precomputed mask (built once per image otherwise)
 
     start_coord - tuple of ints : the coordinates of the starting pixel
 
-    Returns : list of coordinates
+    Returns : Wire, its pixels being in the visiting order
     """
+    img = WhiteMask.of(img)
     wire = []
+    seen = {start_coord}
     queue = deque()
     queue.append(start_coord)
     while len(queue) != 0:
-        current_coord = queue[0]
-        if current_coord not in wire:
-            wire.append(current_coord)
-        visit(img,current_coord,wire,queue)
-        queue.popleft()
-    return wire
+        current_coord = queue.popleft()
+        wire.append(current_coord)
+        visit(img,current_coord,seen,queue)
+    return Wire.fromCoords(wire)
 
 
 
 # Finding the edges coordinates of a given wire
 
-def extremeCoords(wire: list, side = "left") -> int:
+def extremeCoords(wire: Wire, side = "left") -> int:
     """Finds the index of either the leftmost or the rightmost pixel of a wire, depending on the input side.
 
     Arguments :
 
-    wire -- list of coordinates : the list of all pixels in the wire
+    wire -- Wire : the pixels of the wire
 
     side -- string : the side chosen for finding the extreme coordinate, by default : left
 
-    Returns : int
+    Returns : int : the first index reaching the extreme column
     """
-    directions = {"left":-1, "right":1}
-    index = 0
-    for i in range(1,len(wire)):
-        if directions[side] * (wire[i][1] - wire[index][1]) > 0:
-            index = i
-    return index
+    if side == "left":
+        return int(np.argmin(wire.cols))
+    return int(np.argmax(wire.cols))
 
 
-def wireEdges(wire: list,) -> tuple:
+def wireEdges(wire: Wire) -> tuple:
     """Gives the coordinates of both the leftmost and the rightmost pixels of a wire.
 
     Arguments :
 
-    wire -- list of coordinates : the list of all pixels in the wire
+    wire -- Wire : the pixels of the wire
 
     Returns : tuple of coordinates
     """
-    i_left , i_right = extremeCoords(wire, "left"), extremeCoords(wire, "right")
-    return (wire[i_left], wire[i_right])
+    return wire.edges
 
 
 
 # Checking if a wire is touching another
 
-def isTouching(wire: list, threshold = 2900) -> bool:
+def isTouching(wire_size, threshold = 2900):
     """Tests whether or not a wire is touching another by checking if it contains too many pixels.
 
     Arguments :
 
-    wire -- list of coordinates : the list of all pixels in the wire
+    wire_size -- int or array of ints : the number of pixels of the wire(s), as given by labeling.label_white
 
     threshold - int : arbitrary threshold for how many pixels is too many pixels
 
-    Returns : bool
+    Returns : bool or array of bools
     """
-    return len(wire) > threshold
+    return np.asarray(wire_size) > threshold
+
+
+# Finding which wires are in contact
+
+def contactGraph(shared: dict, wires: dict, seeds_rows: np.ndarray, seeds_cols: np.ndarray) -> list:
+    """Groups the wires in contact : the seeds falling in the same white component belong to wires touching each other,
+    directly or through other wires of the group (in a chain A-B-C, A and C are in the same group without touching).
+
+    Arguments :
+
+    shared -- dict {int : array of ints} : the seeds sharing each component, as given by labeling.group_seeds
+
+    wires -- dict {int : Wire} : the wire of each component
+
+    seeds_rows, seeds_cols -- arrays of ints : the coordinates of the seeds
+
+    Returns : list of dicts, one per group of wires in contact, with keys :
+        "component" (int), "seeds" (list of seed indices), "coords" (list of seed coordinates),
+        "bbox" (first row, first column, last row, last column)
+    """
+    groups = []
+    for label, seeds in sorted(shared.items()):
+        seeds = [int(i) for i in seeds]
+        groups.append({"component": label,
+                       "seeds": seeds,
+                       "coords": [(int(seeds_rows[i]), int(seeds_cols[i])) for i in seeds],
+                       "bbox": wires[label].bbox})
+    return groups
+
 
 
 # Combining start pixel detection, wire counting and wire plotting
 
+# Wires detected on less than this fraction of the band are listed in the report
+LOW_CONFIDENCE = 0.8
+
+
+def seedWires(analysis, band = 1):
+    """Finds one pixel (seed) on each wire, on the columns where all the wires are visible
+
+    Arguments :
+
+    analysis - ImageAnalysis : the analysis of the working image
+
+    band - int : number of columns on which the wires are detected, see count.consensus_peaks (a single one by default)
+
+    Returns : seeds_rows, seeds_cols (arrays of ints), and the confidence of each wire (array of floats : the fraction of
+    the band in which it was found, 1 with a single column)
+    """
+    if band > 1:
+        (x_list_left,y_left,conf_left,x_list_right,y_right,conf_right) = wire_consensus(analysis, band)
+        confidence = np.concatenate([conf_left, conf_right])
+    else:
+        (x_list_left,y_left,x_list_right,y_right) = wire_pos(analysis)
+        confidence = np.ones(len(x_list_left) + len(x_list_right))
+    seeds_rows = np.concatenate([x_list_left, x_list_right]).astype(np.int64)
+    seeds_cols = np.concatenate([np.broadcast_to(y_left, len(x_list_left)), np.broadcast_to(y_right, len(x_list_right))]).astype(np.int64)
+    return seeds_rows, seeds_cols, confidence
+
+
 
-def analyseWires(filename: str):
-    """Highlights all the wires in an image, with different colors if a pixel is touching another.
+def analyseWires(filename: str, workers = 1, output = "result", composite = False, band = 1):
+    """Finds the wires in contact in an image, and highlights them (see overlay.write_overlay for the files written).
 
     Arguments : 
 
     filename - str : the file name of the working image
+
+    workers - int : number of processes used to label the wire zone, split into tiles when greater than 1 (same result)
+
+    output - str : the folder where the highlighted wires are saved
+
+    composite - bool : whether or not to also save the full resolution image with the wires painted (slow)
+
+    band - int : number of columns on which the wires are detected, see count.consensus_peaks (a single one by default)
+
+    Returns : int, int, list : the number of wires expected, the number of wires detected, and the contact groups (see contactGraph)
     """
-    count = 0
-    t = time()
-    img = plt.imread(filename)
-    n_expected = expected_wire_number(extract_serial_number(filename),data)
-    copy = img.copy()
-    (x_list_left,y_left,x_list_right,y_right) = wire_pos(img)
-    n_detected = len(x_list_left) + len(x_list_right)
-    for (x_list, y) in [(x_list_left,y_left),(x_list_right,y_right)]:
-        for x in x_list:
-            if count%10 == 0 :
-                print("Status : " + str(int(100 * count/n_detected)) + " %")
-                print("Time spent : " + str(int(time() - t)) + "seconds")
-            count+=1
-            wire = bfsWire(img,(x,y))
-            if isTouching(wire):
-                for pixel in wire:
-                    copy[pixel[0],pixel[1],:] = np.array([0,0,255])
-            edges = wireEdges(wire)
-    cv2.imwrite("result.jpg",copy)
+    img = read_image(filename)
+    analysis = ImageAnalysis(img)
+    n_expected = modules.expected_wire_number(extract_serial_number(filename))
+    seeds_rows, seeds_cols, confidence = seedWires(analysis, band)
+    n_detected = len(seeds_rows)
+
+    # Every white component is labeled once, the seeds then only read their label : a seed falling in a
+    # component already reached by another seed reuses it instead of traversing it again
+    zone = wire_zone(analysis)
+    if workers > 1:
+        labels, sizes = label_white_tiled(img, rows=zone, workers=workers)
+    else:
+        labels, sizes = label_white(WhiteMask.of(analysis), rows=zone)
+    wire_labels, shared = group_seeds(labels, seeds_rows, seeds_cols)
+
+    wires = Wire.fromLabels(labels, wire_labels)
+    contacts = contactGraph(shared, wires, seeds_rows, seeds_cols)
+
+    # wires alone in their component but suspiciously big : probably touching a wire that got no seed
+    alone = np.setdiff1d(wire_labels[wire_labels > 0], list(shared))
+    oversized = alone[isTouching(sizes[alone])]
+
+    write_overlay(output, img, [wires[group["component"]] for group in contacts], read_image(filename, 8), composite)
+    printReport(n_expected, n_detected, contacts, [wires[label] for label in oversized], uncertainWires(seeds_rows, seeds_cols, confidence))
+
+    return n_expected, n_detected, contacts
+
+
+def uncertainWires(seeds_rows, seeds_cols, confidence, threshold = LOW_CONFIDENCE):
+    """Returns : list of (int, int, float) : the seed and the confidence of the wires found on less than threshold of the band"""
+    return [(int(seeds_rows[i]), int(seeds_cols[i]), float(confidence[i])) for i in np.flatnonzero(confidence < threshold)]
+
+
+def printReport(n_expected: int, n_detected: int, contacts: list, oversized: list, uncertain: list = ()):
+    """Prints the result of a check : the wire counts, the groups of wires in contact, the suspiciously big single wires
+    (list of Wire) and the wires detected with a low confidence (see uncertainWires)"""
     print("Wires expected : " + str(n_expected))
-    print("Wires detected : " + str(n_detected))
\ No newline at end of file
+    print("Wires detected : " + str(n_detected))
+    if len(uncertain) != 0:
+        print("Wires found on only part of the band : " + ", ".join(str((r, c)) + " " + str(round(100*conf)) + "%" for (r, c, conf) in uncertain))
+    print("Groups of wires in contact : " + str(len(contacts)))
+    for group in contacts:
+        (r0, c0, r1, c1) = group["bbox"]
+        print("  seeds " + ", ".join(str(coord) for coord in group["coords"]) + " : rows " + str(r0) + "-" + str(r1) + ", columns " + str(c0) + "-" + str(c1))
+    if len(oversized) != 0:
+        print("Single wires with too many pixels : " + ", ".join(str(wire.edges[0]) for wire in oversized))
\ No newline at end of file
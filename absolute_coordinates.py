@@ -1,4 +1,5 @@
-from Coordinates.find_absolute import repere_absolu,find_pads
+from Coordinates.find_absolute import repere_absolu
+from Wiring_Checks.profiling import run_instrumented
 import sys
 
 """
@@ -13,15 +14,20 @@ path - str : the path to the image to analyse.
 
 draw - bool (Optional) : whether or not to return images of evey step of the process.
 
-Returns : Prints the transition matrix to the absolute coordinate system, as well as its origin and the dilatation of the given image
+--profile (Optional) : also dumps cProfile data in <image name>.prof.
+
+Returns : Prints the transition matrix to the absolute coordinate system, as well as its origin and the dilatation of the given image ;
+writes the time spent in each stage in <image name>_timings.json.
 """
 
 if __name__ == '__main__' :
-    path = sys.argv[1]
+    profile = "--profile" in sys.argv
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    path = args[0]
 
-    if len(sys.argv) == 2 :
-        print(repere_absolu(path))
+    if len(args) == 1 :
+        print(run_instrumented(path, repere_absolu, path, profile=profile))
 
     else :
-        draw=sys.argv[2] 
-        print(repere_absolu(path,draw))
\ No newline at end of file
+        draw=args[1] 
+        print(run_instrumented(path, repere_absolu, path, draw, profile=profile))
\ No newline at end of file
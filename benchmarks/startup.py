@@ -0,0 +1,84 @@
+import os
+import subprocess
+import sys
+
+"""
+This file measures the startup time of the scripts : each check runs in its own short lived process, so the imports are
+paid once per image.
+
+Every module is imported in a fresh interpreter, several times, and the best time measured inside the interpreter is
+kept. The heavy libraries loaded by the import are listed : matplotlib, pandas and scipy.stats should only be loaded when
+drawing, and the other ones only by the modules of ALLOWED. The script exits with an error if a module loads a heavy
+library it is not allowed to, which catches the imports made eager again.
+
+Arguments
+-----------
+repeat - int (Optional) : the number of imports measured per module, 5 by default.
+
+--max=<ms> (Optional) : exits with an error if a module takes longer than this to import.
+
+Returns : prints the import time of each module and the heavy libraries it loaded, and exits with an error if one is not
+allowed or if a module is too slow.
+"""
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules imported by the scripts, for each mode of check_wiring.py and absolute_coordinates.py
+MODULES = ["Wiring_Checks.wire", "Wiring_Checks.streaming", "Coordinates.find_absolute", "Coordinates.crop_efficace",
+           "Coordinates.recherche_pads"]
+
+HEAVY = ["matplotlib", "pandas", "scipy.stats", "scipy.signal", "scipy.ndimage"]
+
+# Heavy libraries a module needs for its work, and may therefore load at startup
+ALLOWED = {"Wiring_Checks.wire" : ["scipy.ndimage"], "Wiring_Checks.streaming" : ["scipy.ndimage"],
+           "Coordinates.crop_efficace" : ["scipy.ndimage"]}
+
+_child = """
+import sys
+from time import perf_counter
+start = perf_counter()
+%s
+print(perf_counter() - start)
+print(",".join(name for name in %r if name in sys.modules))
+"""
+
+
+def import_time(module, repeat = 5):
+    """Imports a module in fresh interpreters and measures the best time.
+
+    Arguments :
+
+    module - str : the module to import
+
+    repeat - int : the number of measures
+
+    Returns : float, list of str : the best import time in seconds (measured in the interpreter, without its own startup),
+    and the heavy libraries loaded by the import
+    """
+    code = _child % ("import " + module, HEAVY)
+    best, loaded = float("inf"), []
+    for _ in range(repeat) :
+        output = subprocess.run([sys.executable, "-c", code], cwd=_root, capture_output=True, text=True, check=True).stdout.split("\n")
+        best = min(best, float(output[0]))
+        loaded = [name for name in output[1].split(",") if name != ""]
+    return best, loaded
+
+
+if __name__ == '__main__' :
+    maximum = [float(arg.split("=")[1]) / 1000 for arg in sys.argv if arg.startswith("--max=")]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    repeat = int(args[0]) if len(args) != 0 else 5
+
+    slow, eager = [], []
+    for module in MODULES :
+        elapsed, loaded = import_time(module, repeat)
+        forbidden = [name for name in loaded if name not in ALLOWED.get(module, [])]
+        print(f"{module:<30} {1000*elapsed:>6.0f} ms    loads : {', '.join(loaded) if loaded else '-'}"
+              + (f"    (not allowed : {', '.join(forbidden)})" if forbidden else ""))
+        if len(maximum) != 0 and elapsed > maximum[0] :
+            slow.append(module)
+        if len(forbidden) != 0 :
+            eager.append(module + " (" + ", ".join(forbidden) + ")")
+
+    assert len(eager) == 0, "Heavy library imported at startup : " + ", ".join(eager)
+    assert len(slow) == 0, "Import too slow : " + ", ".join(slow)
@@ -1,4 +1,4 @@
-from Wiring_Checks.wire import analyseWires
+from Wiring_Checks.profiling import run_instrumented
 import sys
 
 """
@@ -8,9 +8,47 @@ Arguments
 -----------
 path - str : the path to the image to analyse.
 
-Returns : the wire count next to the theoretical one ; creates an image highlighting the touching wires.
+workers - int (Optional) : the number of processes used to label the wires, 1 by default.
+
+--composite (Optional) : also writes the full resolution image with the touching wires painted.
+
+--profile (Optional) : also dumps cProfile data in <image name>.prof.
+
+--stream (Optional) : reads the image by horizontal strips from a memory-mapped copy, to bound the memory used by the analysis
+(workers is then ignored). The copy is made by a full decode of the image, in memory, unless a previous run kept it (--keep-raw).
+
+--budget=<MiB> (Optional) : peak memory allowed to a strip in streaming mode, 256 MiB by default (implies --stream).
+
+--keep-raw (Optional) : in streaming mode, keeps the decoded copy of the image, so that the next runs do not decode it again
+and stay within the budget (removed by default ; the copies are kept in the "wiring_raw" temporary folder).
+
+--band=<K> (Optional) : detects the wires on K columns instead of one, and lists the wires found on only part of them.
+
+Returns : the wire count next to the theoretical one ; writes the touching wires in the "result" folder (sparse mask, 
+overlay, thumbnails and preview) ; writes the time spent in each stage in <image name>_timings.json.
 """
 
 if __name__ == '__main__' :
-    path = sys.argv[1]
-    analyseWires(path)
\ No newline at end of file
+    composite = "--composite" in sys.argv
+    profile = "--profile" in sys.argv
+    budget = [int(arg.split("=")[1]) * 2**20 for arg in sys.argv if arg.startswith("--budget=")]
+    band = [int(arg.split("=")[1]) for arg in sys.argv if arg.startswith("--band=")]
+    band = band[0] if len(band) != 0 else 1
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    path = args[0]
+
+    # Only the modules of the requested mode are imported : the script is started once per image
+    if "--stream" in sys.argv or len(budget) != 0 :
+        from Wiring_Checks.streaming import analyseWiresStreaming
+        kwargs = {"budget" : budget[0]} if len(budget) != 0 else {}
+        kwargs["keep_raw"] = "--keep-raw" in sys.argv
+        run_instrumented(path, analyseWiresStreaming, path, composite=composite, band=band, profile=profile, **kwargs)
+
+    elif len(args) == 1 :
+        from Wiring_Checks.wire import analyseWires
+        run_instrumented(path, analyseWires, path, composite=composite, band=band, profile=profile)
+
+    else :
+        from Wiring_Checks.wire import analyseWires
+        workers = int(args[1])
+        run_instrumented(path, analyseWires, path, workers, composite=composite, band=band, profile=profile)
\ No newline at end of file